@@ -9,16 +9,25 @@ __version__ = "0.1.0"
 try:
     from .padanalytics import (
         get_data_api,
+        iter_data_api,
+        save_data_api,
+        iter_project_cards,
         get_card_issues,
         get_projects,
         get_project_cards,
         get_card_by_id,
         get_card_by_sample_id,
+        get_cards_by_sample_ids,
+        get_cards,
+        get_cards_async,
         get_card,
         get_project_by_id,
         get_project_by_name,
         get_project,
+        get_project_catalog,
+        ProjectCatalog,
         load_image_from_url,
+        load_card_image,
         show_card,
         show_grouped_cards,
         show_cards_from_df,
@@ -47,10 +56,14 @@ except ImportError as e:
 try:
     from . import pad_analysis
     from . import pad_helper
+    from . import pad_session
+    from . import pad_cache
+    from . import pad_image_cache
     from . import fileManagement
     from . import intensityFind
     from . import pixelProcessing
     from . import regionRoutine
+    from . import roiGeometry
 except ImportError as e:
     import warnings
     warnings.warn(f"Could not import some submodules: {e}")
@@ -62,16 +75,25 @@ if _PADANALYTICS_IMPORTED:
     __all__.extend([
         # Main functions from padanalytics
         "get_data_api",
+        "iter_data_api",
+        "save_data_api",
+        "iter_project_cards",
         "get_card_issues", 
         "get_projects",
         "get_project_cards",
         "get_card_by_id",
         "get_card_by_sample_id",
+        "get_cards_by_sample_ids",
+        "get_cards",
+        "get_cards_async",
         "get_card",
         "get_project_by_id",
         "get_project_by_name", 
         "get_project",
+        "get_project_catalog",
+        "ProjectCatalog",
         "load_image_from_url",
+        "load_card_image",
         "show_card",
         "show_grouped_cards",
         "show_cards_from_df",
@@ -92,6 +114,6 @@ if _PADANALYTICS_IMPORTED:
     ])
 
 # Add available submodules
-for module_name in ["pad_analysis", "pad_helper", "fileManagement", "intensityFind", "pixelProcessing", "regionRoutine"]:
+for module_name in ["pad_analysis", "pad_helper", "pad_session", "pad_cache", "pad_image_cache", "fileManagement", "intensityFind", "pixelProcessing", "regionRoutine", "roiGeometry"]:
     if module_name in globals():
         __all__.append(module_name)
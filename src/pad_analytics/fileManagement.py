@@ -1,6 +1,10 @@
+import io
 import os
 import sys
+import json
+import struct
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import cv2 as cv
 import matplotlib.pyplot as plt
@@ -147,6 +151,7 @@ MASTER_INDEX = [
     "L3-B",
 ]
 COLORS = ["R", "G", "B"]
+LANE_LETTERS = ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L"]
 # COLORS = ['L','a','b']
 
 
@@ -177,8 +182,14 @@ def genIndex(regions, ColorList=["R", "G", "B"]):
     return index
 
 
+# Merges the per-image CSVs in target into the master CSV. Files are parsed
+# in workers threads, cards already in the master (compared as strings) are
+# skipped, and the new rows are added with a single concat and write.
 def compressCSVs(
-    masterName=SAVE_DIR + "/master.csv", target=SAVE_DIR + REQS["CSV_DIR"], regions=3
+    masterName=SAVE_DIR + "/master.csv",
+    target=SAVE_DIR + REQS["CSV_DIR"],
+    regions=3,
+    workers=8,
 ):
     try:
         masterDF = pd.read_csv(masterName, index_col=0)
@@ -186,24 +197,45 @@ def compressCSVs(
     except Exception as e:
         masterDF = None
     index = genIndex(regions)
+    seen = set() if masterDF is None else set(masterDF.index.astype(str))
+    numbers = []
     for item in os.listdir(target):
-        if item[-4:] == ".csv":
-            number = item[:-4]
-            data = convertToDF(target + "/" + item, number, index, regions)
-            if masterDF is None:
-                masterDF = pd.DataFrame(data, columns=index, index=[data["Image"]])
-            else:
-                if number in masterDF.index:
-                    pass
-                else:
-                    tempDF = pd.DataFrame(data, columns=index, index=[data["Image"]])
-                    masterDF = pd.concat([masterDF, tempDF])
+        if item[-4:] == ".csv" and item[:-4] not in seen:
+            seen.add(item[:-4])
+            numbers.append(item[:-4])
+    if numbers:
+        paths = [target + "/" + number + ".csv" for number in numbers]
+        with ThreadPoolExecutor(max(1, workers)) as pool:
+            rows = list(pool.map(lambda path: _regionValues(path, regions), paths))
+        newDF = pd.DataFrame(np.stack(rows), columns=index[4:], index=numbers)
+        newDF.insert(0, "Image", numbers)
+        newDF.insert(1, "Contains", "N/A")
+        newDF.insert(2, "Drug %", np.nan)
+        newDF.insert(3, "PAD S#", numbers)
+        masterDF = newDF if masterDF is None else pd.concat([masterDF, newDF])
     if masterDF is not None:
         masterDF.to_csv(masterName)
 
 
+# Reads the lane/region colors of a per-image CSV as one flat row, in the
+# column order of genIndex. Same values as convertToDF.
+def _regionValues(file, regions=3):
+    df = pd.read_csv(file, usecols=COLORS)
+    return df.to_numpy()[: 12 * regions].ravel()
+
+
+# Counts how often each Lab color occurs per lane (and over "All" lanes)
+# in the master CSV. Rows are filtered by str(row[req]) == str(targetPercent)
+# and by membership in reqName. With quantize > 1 colors are floored to
+# multiples of quantize before counting. Returns (laneHash, nameList), with
+# colors in each lane in order of first appearance.
 def readLanes(
-    target=SAVE_DIR + "/master.csv", regions=3, req=None, targetPercent=0, reqName=None
+    target=SAVE_DIR + "/master.csv",
+    regions=3,
+    req=None,
+    targetPercent=0,
+    reqName=None,
+    quantize=1,
 ):
     try:
         masterDF = pd.read_csv(target, index_col=0)
@@ -211,51 +243,48 @@ def readLanes(
         print(e)
         return
     nameList = []
+    keep = np.ones(len(masterDF), dtype=bool)
+    if req is not None:
+        keep = np.array(masterDF[req].map(str) == str(targetPercent))
+        nameList = list(masterDF.index[keep])
+    if reqName is not None:
+        keep &= np.array([item in reqName for item in masterDF.index], dtype=bool)
+    columns = [
+        letter + str(j) + "-" + color
+        for letter in LANE_LETTERS
+        for j in range(1, regions + 1)
+        for color in ["L", "a", "b"]
+    ]
+    colors = masterDF[columns].to_numpy()[keep]
+    colors = colors.reshape(len(colors), len(LANE_LETTERS), regions, 3)
+    if quantize > 1:
+        colors = colors // quantize * quantize
     laneHash = {
-        "A": {},
-        "B": {},
-        "C": {},
-        "D": {},
-        "E": {},
-        "F": {},
-        "G": {},
-        "H": {},
-        "I": {},
-        "J": {},
-        "K": {},
-        "L": {},
-        "All": {},
+        letter: _colorCounts(colors[:, lane])
+        for lane, letter in enumerate(LANE_LETTERS)
     }
-    for item in masterDF.index:
-        if req is not None:
-            targetVal = masterDF.loc[item][req]
-            if str(targetVal) != str(targetPercent):
-                continue
-            else:
-                nameList.append(item)
-        if reqName is not None:
-            if item not in reqName:
-                continue
-        for letter in ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L"]:
-            for j in range(1, regions + 1):
-                cColor = [0, 0, 0]
-                i = 0
-                for color in ["L", "a", "b"]:
-                    tempStr = letter + str(j) + "-" + color
-                    cColor[i] = masterDF.loc[item][tempStr]
-                    i += 1
-                cColor = tuple(cColor)
-                if cColor not in laneHash[letter].keys():
-                    laneHash[letter][cColor] = 0
-                if cColor not in laneHash["All"].keys():
-                    laneHash["All"][cColor] = 0
-                laneHash[letter][cColor] += 1
-                laneHash["All"][cColor] += 1
+    laneHash["All"] = _colorCounts(colors)
     return laneHash, nameList
 
 
-def graphLanes(laneHash, lane="A"):
-    colors = laneHash[lane]
+# Returns {color tuple: count} over the last axis of colors, in order of
+# first appearance
+def _colorCounts(colors):
+    colors = colors.reshape(-1, 3)
+    if len(colors) == 0:
+        return {}
+    unique, first, counts = np.unique(
+        colors, axis=0, return_index=True, return_counts=True
+    )
+    order = np.argsort(first)
+    return dict(zip(map(tuple, unique[order].tolist()), counts[order].tolist()))
+
+
+# Plots the colors of one lane of a readLanes laneHash in RGB space, one
+# point per color sized by its count, in a single scatter call. quantize
+# and maxPoints are passed to colorPoints to keep large hashes interactive.
+def graphLanes(laneHash, lane="A", quantize=1, maxPoints=None):
+    points, sizes = colorPoints(laneHash[lane], quantize, maxPoints)
     fig = plt.figure()
     ax = fig.add_subplot(111, projection="3d")
     ax.set_xlabel("R")
@@ -263,23 +292,18 @@ def graphLanes(laneHash, lane="A"):
     ax.set_zlabel("B")
     name = "Lane " + lane + " colorMap"
     ax.set_title(name)
-    for r, g, b in colors.keys():
-        s = colors[(r, g, b)]
-        r /= 255.0
-        g /= 255.0
-        b /= 255.0
-        ax.scatter3D(r, g, b, c=[r, g, b], s=s)
+    ax.scatter3D(points[:, 0], points[:, 1], points[:, 2], c=points, s=sizes)
     plt.savefig(SAVE_DIR + name + ".png")
     plt.show()
 
 
-def graphComparison(laneList, lane="A", name="Aceta"):
+def graphComparison(laneList, lane="A", name="Aceta", quantize=1, maxPoints=None):
     fig = plt.figure()
     i = 1
     keys = list(laneList.keys())
     keys.sort(key=int)
     for item in keys:
-        colors = laneList[item][lane]
+        points, sizes = colorPoints(laneList[item][lane], quantize, maxPoints)
         ax = fig.add_subplot(1, len(laneList), i, projection="3d")
         ax.set_xlabel("R")
         ax.set_ylabel("G")
@@ -287,17 +311,31 @@ def graphComparison(laneList, lane="A", name="Aceta"):
         ax.set_xticklabels([])
         ax.set_yticklabels([])
         ax.set_zticklabels([])
-        for r, g, b in colors.keys():
-            s = colors[(r, g, b)]
-            r /= 255.0
-            g /= 255.0
-            b /= 255.0
-            ax.scatter3D(r, g, b, c=[r, g, b], s=s)
+        ax.scatter3D(points[:, 0], points[:, 1], points[:, 2], c=points, s=sizes)
         ax.set_title(item)
         i += 1
     fig.canvas.set_window_title(name)
 
 
+# Turns a {color: count} hash into (points, sizes) arrays for one scatter
+# call, with points scaled to [0, 1]. With quantize > 1 colors are floored
+# to multiples of quantize and their counts summed; with maxPoints only the
+# most frequent colors are kept.
+def colorPoints(colors, quantize=1, maxPoints=None):
+    points = np.array(list(colors.keys()), dtype=np.float64).reshape(-1, 3)
+    sizes = np.array(list(colors.values()), dtype=np.float64)
+    if quantize > 1 and len(points):
+        points, inverse = np.unique(
+            points // quantize * quantize, axis=0, return_inverse=True
+        )
+        sizes = np.bincount(inverse.ravel(), weights=sizes, minlength=len(points))
+    if maxPoints is not None and len(points) > maxPoints:
+        keep = np.argpartition(sizes, len(sizes) - maxPoints)[-maxPoints:]
+        keep.sort()
+        points, sizes = points[keep], sizes[keep]
+    return np.clip(points / 255.0, 0.0, 1.0), sizes
+
+
 def outputFile(
     file,
     origImg,
@@ -341,6 +379,386 @@ def outputFile(
     errors.close()
 
 
+# Checkpoint manifest for long extraction runs. Each commit is one JSON
+# line listing the cards finished (with the settings written for them) and
+# the size of each output file afterwards, appended and fsync'd in a single
+# write. A torn last line from a crash is ignored on load, and rollback()
+# truncates outputs back to their last committed size, so a rerun skips
+# completed cards and writes every row exactly once.
+class RunManifest:
+    def __init__(self, path):
+        self.path = path
+        self.completed = {}
+        self.sizes = {}
+        if os.path.exists(path):
+            self._load()
+        self._file = open(path, "a")
+
+    def _load(self):
+        with open(self.path, "r+b") as manifest:
+            committed = 0
+            for line in manifest:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                committed += len(line)
+                for cardId, settings in entry["cards"]:
+                    self.completed.setdefault(cardId, set()).update(settings)
+                self.sizes.update(entry["sizes"])
+            # Drop a torn tail from a crash so new commits start on a clean line
+            manifest.truncate(committed)
+
+    # Settings of the given list not yet committed for a card
+    def pending(self, cardId, settings):
+        done = self.completed.get(str(cardId), set())
+        return [setting for setting in settings if setting not in done]
+
+    def isDone(self, cardId, settings):
+        return not self.pending(cardId, settings)
+
+    # Records a card as written for settings. outputs are the files the
+    # rows went to; their current sizes become the committed sizes.
+    def commit(self, cardId, settings, outputs=()):
+        self.commitBatch([(cardId, settings)], outputs)
+
+    # Records several (cardId, settings) as written, atomically. Used when
+    # rows are flushed in chunks, after the chunk has reached the outputs.
+    def commitBatch(self, cards, outputs=()):
+        sizes = {
+            output: os.path.getsize(output) if os.path.exists(output) else 0
+            for output in outputs
+        }
+        cards = [(str(cardId), list(settings)) for cardId, settings in cards]
+        entry = {"cards": cards, "sizes": sizes}
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        for cardId, settings in cards:
+            self.completed.setdefault(cardId, set()).update(settings)
+        self.sizes.update(sizes)
+
+    # Brings outputs back to their last committed size, dropping rows that
+    # were written after the last commit of an interrupted run. Outputs not
+    # seen before are committed as they are now, before anything is written.
+    def rollback(self, outputs):
+        untracked = [output for output in outputs if output not in self.sizes]
+        if untracked:
+            self.commitBatch([], untracked)
+        for output in outputs:
+            size = self.sizes[output]
+            if not os.path.exists(output) or os.path.getsize(output) <= size:
+                continue
+            if size == 0:
+                # Nothing was committed, not even a header
+                os.remove(output)
+            else:
+                with open(output, "r+b") as partial:
+                    partial.truncate(size)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Buffered feature table writer. Rows are kept in memory and written in
+# chunks of flushRows: to a CSV laid out like the per-setting csvReader
+# outputs ("csv"), and/or to a columnar binary table ("npy"): the feature
+# matrix in <base>.npy, the metadata columns in a <base>.index.csv sidecar
+# and the feature column names in <base>.columns.json. Reopening an
+# existing table appends to it; readFeatureTable loads the binary form.
+class FeatureTableWriter:
+    def __init__(
+        self,
+        path,
+        featureColumns,
+        metaColumns=("Image", "Contains", "Drug %", "PAD S#"),
+        formats=("csv",),
+        flushRows=500,
+        dtype=np.int64,
+    ):
+        unknown = set(formats) - {"csv", "npy"}
+        if unknown:
+            raise ValueError("Unknown feature table formats %s" % sorted(unknown))
+        self.path = path
+        self.base = os.path.splitext(path)[0]
+        self.featureColumns = list(featureColumns)
+        self.metaColumns = list(metaColumns)
+        self.formats = tuple(formats)
+        self.flushRows = flushRows
+        self.dtype = np.dtype(dtype)
+        self._meta = []
+        self._features = []
+        if "npy" in self.formats:
+            # A crash between the two writes of a flush leaves one file with
+            # rows the other lacks; drop them so labels stay aligned
+            indexPath = self.base + ".index.csv"
+            labelled = _readIndexRows(indexPath)
+            self._npyRows = _openNpyTable(
+                self.base + ".npy",
+                len(self.featureColumns),
+                self.dtype,
+                maxRows=0 if labelled is None else len(labelled),
+            )
+            if labelled is not None and len(labelled) > self._npyRows:
+                labelled.iloc[: self._npyRows].to_csv(indexPath, index=False)
+            _writeColumns(self.base + ".columns.json", self.featureColumns)
+
+    # Files a table at path appends to in the given formats, e.g. for
+    # RunManifest commits and rollbacks
+    @staticmethod
+    def outputsFor(path, formats=("csv",)):
+        base = os.path.splitext(path)[0]
+        outputs = []
+        if "csv" in formats:
+            outputs.append(path)
+        if "npy" in formats:
+            outputs += [base + ".npy", base + ".index.csv"]
+        return outputs
+
+    @property
+    def outputs(self):
+        return self.outputsFor(self.path, self.formats)
+
+    # Buffers one row. meta holds the metaColumns values, features the
+    # featureColumns values. Returns True when the buffer was flushed; with
+    # flushRows=None the caller flushes explicitly.
+    def append(self, meta, features):
+        self._meta.append(list(meta))
+        self._features.append(np.asarray(features, dtype=self.dtype).ravel())
+        if self.flushRows is not None and len(self._meta) >= self.flushRows:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        if not self._meta:
+            return
+        features = np.stack(self._features)
+        if "csv" in self.formats:
+            df = pd.DataFrame(features, columns=self.featureColumns)
+            for i, column in enumerate(self.metaColumns):
+                df.insert(i, column, [row[i] for row in self._meta])
+            df.index = [row[0] for row in self._meta]
+            newFile = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            df.to_csv(self.path, mode="a", header=newFile)
+        if "npy" in self.formats:
+            self._npyRows = _appendNpyRows(self.base + ".npy", features, self._npyRows)
+            index = pd.DataFrame(self._meta, columns=self.metaColumns)
+            indexPath = self.base + ".index.csv"
+            newFile = not os.path.exists(indexPath) or os.path.getsize(indexPath) == 0
+            index.to_csv(indexPath, mode="a", header=newFile, index=False)
+        self._meta = []
+        self._features = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Loads a table written by FeatureTableWriter with the "npy" format as a
+# DataFrame of the metadata and feature columns. The feature matrix is
+# memory-mapped, so this takes milliseconds even for large tables.
+def readFeatureTable(path):
+    base = os.path.splitext(path)[0]
+    with open(base + ".columns.json") as handle:
+        columns = json.load(handle)["columns"]
+    features = _readNpyTable(base + ".npy")
+    index = pd.read_csv(base + ".index.csv", dtype=str, keep_default_na=False)
+    df = pd.DataFrame(np.asarray(features), columns=columns)
+    df = pd.concat([index.iloc[: len(df)], df], axis=1)
+    df.index = df[index.columns[0]]
+    return df
+
+
+# .npy header of fixed size, so the row count can be rewritten in place
+_NPY_HEADER_LEN = 128
+
+
+def _npyHeader(rows, columns, dtype):
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d, %d), }" % (
+        np.lib.format.dtype_to_descr(dtype),
+        rows,
+        columns,
+    )
+    prefix = np.lib.format.magic(1, 0)
+    size = _NPY_HEADER_LEN - len(prefix) - 2
+    header = header.ljust(size - 1) + "\n"
+    return prefix + np.uint16(size).tobytes() + header.encode("latin1")
+
+
+# Opens (or creates) an appendable .npy table and returns its row count.
+# A partially written last row, e.g. from a rollback, is truncated, and so
+# are the rows past maxRows.
+def _openNpyTable(path, columns, dtype, maxRows=None):
+    rowBytes = columns * dtype.itemsize
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        with open(path, "wb") as table:
+            table.write(_npyHeader(0, columns, dtype))
+        return 0
+    with open(path, "r+b") as table:
+        version = np.lib.format.read_magic(table)
+        if version != (1, 0):
+            raise ValueError("Existing table %s is not an appendable table" % path)
+        shape, _, found = np.lib.format.read_array_header_1_0(table)
+        if table.tell() != _NPY_HEADER_LEN or found != dtype or shape[1:] != (columns,):
+            raise ValueError(
+                "Existing table %s does not match %d %s columns"
+                % (path, columns, dtype)
+            )
+        rows = (os.path.getsize(path) - _NPY_HEADER_LEN) // rowBytes
+        if maxRows is not None:
+            rows = min(rows, maxRows)
+        table.truncate(_NPY_HEADER_LEN + rows * rowBytes)
+        table.seek(0)
+        table.write(_npyHeader(rows, columns, dtype))
+    return rows
+
+
+# Reads the index of a "npy" feature table, or returns None when there is
+# none yet
+def _readIndexRows(path):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+# Maps an appendable .npy table read-only. The row count is taken from the
+# file size, since a rollback truncates rows without rewriting the header.
+def _readNpyTable(path):
+    with open(path, "rb") as table:
+        np.lib.format.read_magic(table)
+        shape, _, dtype = np.lib.format.read_array_header_1_0(table)
+    rows = (os.path.getsize(path) - _NPY_HEADER_LEN) // (shape[1] * dtype.itemsize)
+    if rows == 0:
+        return np.empty((0, shape[1]), dtype=dtype)
+    return np.memmap(
+        path, dtype=dtype, mode="r", offset=_NPY_HEADER_LEN, shape=(rows, shape[1])
+    )
+
+
+# Appends rows to an appendable .npy table and returns the new row count
+def _appendNpyRows(path, features, rows):
+    with open(path, "r+b") as table:
+        table.seek(0, os.SEEK_END)
+        table.write(np.ascontiguousarray(features).tobytes())
+        rows += features.shape[0]
+        table.seek(0)
+        table.write(_npyHeader(rows, features.shape[1], features.dtype))
+    return rows
+
+
+# Writes the feature column names next to a binary table, atomically
+def _writeColumns(path, columns):
+    temp = path + ".tmp"
+    with open(temp, "w") as handle:
+        json.dump({"columns": columns}, handle)
+    os.replace(temp, path)
+
+
+# Returns the (height, width, 3) shape cv.imread would give a PNG or JPEG,
+# read from its header without decoding the pixels. source is a path or the
+# encoded bytes. JPEG EXIF orientation is honoured as imread does. Returns
+# None for other formats, so callers can fall back to a full decode, and
+# raises ValueError for a malformed header.
+def imageShape(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return _headerShape(io.BytesIO(source))
+    with open(source, "rb") as handle:
+        return _headerShape(handle)
+
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Start-of-frame markers; C4 (DHT), C8 (JPG) and CC (DAC) share the range
+_JPEG_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# JPEG markers without a length field
+_JPEG_STANDALONE = frozenset([0x01, 0xD8]) | frozenset(range(0xD0, 0xD8))
+
+
+def _headerShape(handle):
+    start = handle.read(8)
+    try:
+        if start == _PNG_SIGNATURE:
+            length, chunk, width, height = struct.unpack(">I4sII", handle.read(16))
+            if chunk != b"IHDR":
+                raise ValueError("PNG does not start with an IHDR chunk")
+            return _checkedShape(height, width)
+        if start[:2] == b"\xff\xd8":
+            handle.seek(2)
+            return _jpegShape(handle)
+    except struct.error:
+        raise ValueError("image header is truncated")
+    return None
+
+
+def _jpegShape(handle):
+    orientation = None
+    while True:
+        byte = handle.read(1)
+        if byte != b"\xff":
+            if not byte:
+                raise ValueError("image header is truncated")
+            raise ValueError("malformed JPEG marker")
+        code = handle.read(1)
+        while code == b"\xff":
+            code = handle.read(1)
+        if not code:
+            raise ValueError("image header is truncated")
+        code = code[0]
+        if code in _JPEG_STANDALONE:
+            continue
+        if code in (0xD9, 0xDA):
+            raise ValueError("JPEG has no frame header before its image data")
+        (length,) = struct.unpack(">H", handle.read(2))
+        if length < 2:
+            raise ValueError("malformed JPEG segment length")
+        if code in _JPEG_SOF:
+            _, height, width = struct.unpack(">BHH", handle.read(5))
+            if orientation in (5, 6, 7, 8):
+                height, width = width, height
+            return _checkedShape(height, width)
+        segment = handle.read(length - 2) if code == 0xE1 else None
+        if segment is None:
+            handle.seek(length - 2, os.SEEK_CUR)
+        elif orientation is None and segment[:6] == b"Exif\x00\x00":
+            orientation = _exifOrientation(segment[6:])
+
+
+# Returns the orientation tag of an EXIF TIFF block, or None
+def _exifOrientation(tiff):
+    try:
+        order = {b"II": "<", b"MM": ">"}[tiff[:2]]
+        (offset,) = struct.unpack(order + "I", tiff[4:8])
+        (count,) = struct.unpack(order + "H", tiff[offset : offset + 2])
+        for entry in range(offset + 2, offset + 2 + 12 * count, 12):
+            tag, kind, _, value = struct.unpack(
+                order + "HHIH", tiff[entry : entry + 10]
+            )
+            if tag == 0x0112 and kind == 3:
+                return value
+    except (KeyError, struct.error):
+        pass
+    return None
+
+
+def _checkedShape(height, width):
+    if height == 0 or width == 0:
+        raise ValueError("image header has an empty size")
+    return (height, width, 3)
+
+
 def stripSuffix(file):
     ret = file.replace(".jpg", "")
     return ret
@@ -1,9 +1,13 @@
 import cv2 as cv
 import numpy as np
 import math
+from functools import lru_cache
 
 BLACK_THRESH_S = 35
 BLACK_THRESH_V = 70
+# Number of distinct (shape, center) weight maps kept per process. ROI
+# shapes are fixed by the lane/region layout, so this is never hit in practice.
+WEIGHT_CACHE_SIZE = 128
 
 
 # Takes a HSV image and returns a list of the most intense pixels in it
@@ -24,31 +28,97 @@ def findMaxIntensities(img):
 
 # Takes a HSV image and returns a list of the most intense pixels in it,
 # after applying filtering to minimize black bars on the edges
-def findMaxIntensitiesFiltered(img):
-    imgS = img[:, :, 1]
-    imgV = img[:, :, 2]
-    maxI = 0
-    maxSet = []
-    centerX = imgS.shape[0] / 2
-    centerY = imgS.shape[1] / 2
-    # print("centers x/y", centerX, centerY)
-    for i in range(imgS.shape[0]):
-        dX = abs(centerX - i)
-        for j in range(imgS.shape[1]):
-            dY = abs(centerY - j)
-            sF = cosCorrectFactor(dX, dY, centerX, centerY)
-            cS = sF * imgS[i, j]
-            cV = sF * imgV[i, j]
-            if cS <= BLACK_THRESH_S and cV <= BLACK_THRESH_V:
-                pass
-            else:
-                maxSet.append((i, j))
-            # elif cS > maxI:
-            #   maxI = imgS[i,j]
-            #   maxSet = [(i,j)]
-            # elif cS == maxI:
-            #   maxSet.append((i,j))
-    return maxSet
+def findMaxIntensitiesFiltered(img, asMask=False):
+    mask = findFilteredMask(img)
+    if asMask:
+        return mask
+    # Compatibility output: (row, col) tuples in row-major order
+    rows, cols = np.nonzero(mask)
+    return list(zip(rows.tolist(), cols.tolist()))
+
+
+# Takes a HSV image and returns a boolean mask of the pixels kept by
+# findMaxIntensitiesFiltered. Pixels whose cosine-weighted S and V both
+# fall under the black thresholds are dropped.
+def findFilteredMask(img):
+    thresholds = filterThresholds(img.shape[0], img.shape[1])
+    return applyThresholdFilter(img, thresholds)
+
+
+# Takes a HSV image (or an (N, H, W, 3) stack) and the (S, V) threshold
+# maps of weightThresholds and returns the filter mask using integer
+# comparisons only. Threshold maps laid out side by side filter a whole
+# card at once; a stack is filtered with the same maps, giving (N, H, W).
+def applyThresholdFilter(img, thresholds):
+    threshS, threshV = thresholds
+    return ~((img[..., 1] <= threshS) & (img[..., 2] <= threshV))
+
+
+# Takes a weight map and returns, per pixel, the largest S and the largest V
+# value (0-255) whose weighted value is still under the black thresholds,
+# or -1 when there is none, as int16 arrays. Weighted values only grow with
+# S and V, so comparing raw values against these maps is exact.
+def weightThresholds(weights):
+    values, inverse = np.unique(weights, return_inverse=True)
+    weighted = values[:, None] * np.arange(256, dtype=np.float64)
+    threshS = (weighted <= BLACK_THRESH_S).sum(axis=1) - 1
+    threshV = (weighted <= BLACK_THRESH_V).sum(axis=1) - 1
+    threshS = threshS[inverse].reshape(weights.shape).astype(np.int16)
+    threshV = threshV[inverse].reshape(weights.shape).astype(np.int16)
+    threshS.setflags(write=False)
+    threshV.setflags(write=False)
+    return threshS, threshV
+
+
+# Returns the cached weightThresholds of cosWeightMap for an ROI shape
+def filterThresholds(height, width, centerX=None, centerY=None):
+    if centerX is None:
+        centerX = height / 2
+    if centerY is None:
+        centerY = width / 2
+    return _cachedThresholds(int(height), int(width), float(centerX), float(centerY))
+
+
+@lru_cache(maxsize=WEIGHT_CACHE_SIZE)
+def _cachedThresholds(height, width, centerX, centerY):
+    return weightThresholds(_cachedWeightMap(height, width, centerX, centerY))
+
+
+# Takes an ROI height and width and returns the cosCorrectFactor weight of
+# every pixel as a read-only float64 array. Maps are cached per shape and
+# center, so repeated ROIs never touch math.cos again.
+def cosWeightMap(height, width, centerX=None, centerY=None):
+    if centerX is None:
+        centerX = height / 2
+    if centerY is None:
+        centerY = width / 2
+    return _cachedWeightMap(int(height), int(width), float(centerX), float(centerY))
+
+
+# Returns hit/miss statistics for the weight map cache
+def weightCacheInfo():
+    return _cachedWeightMap.cache_info()
+
+
+# Empties the weight map and threshold caches
+def clearWeightCache():
+    _cachedWeightMap.cache_clear()
+    _cachedThresholds.cache_clear()
+
+
+# The cosine is evaluated with math.cos on the distinct distances only,
+# so weights match cosCorrectFactor exactly.
+@lru_cache(maxsize=WEIGHT_CACHE_SIZE)
+def _cachedWeightMap(height, width, centerX, centerY):
+    dX = np.abs(centerX - np.arange(height, dtype=np.float64)) / centerX
+    dY = np.abs(centerY - np.arange(width, dtype=np.float64)) / centerY
+    relevantD = np.maximum(dX[:, None], dY[None, :])
+    values, inverse = np.unique(relevantD, return_inverse=True)
+    cosValues = np.array([math.cos((math.pi / 2) * d) for d in values])
+    weights = cosValues[inverse].reshape(height, width)
+    # Shared between callers, so guard against in-place edits
+    weights.setflags(write=False)
+    return weights
 
 
 # Takes a distance from a center and returns a weight between 0 and 1
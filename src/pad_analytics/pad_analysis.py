@@ -40,19 +40,19 @@ class pls:
             if not padanalytics.DEBUG_MODE:
                 print("Processing PAD image... (libpng warnings can be safely ignored)")
 
-            # grab image with stderr suppression for libpng errors
+            # grab image (path, encoded bytes or ndarray) with stderr
+            # suppression for libpng errors
             with padanalytics.suppress_stderr():
-                img = cv.imread(in_file)
+                img = padanalytics.load_card_image(in_file)
 
             # Clean up the display if not in debug mode
             if not padanalytics.DEBUG_MODE:
                 print("\r" + " " * 60 + "\r", end="")  # Clear the line
 
-            # pls dictionary
-            f = {}
-            f = regionRoutine.fullRoutine(
-                img, regionRoutine.intFind.findMaxIntensitiesFiltered, f, True, 10
-            )
+            # pls feature vector, in A1-R, A1-G, A1-B, A2-R, ... order
+            features = regionRoutine.extractFeatures(
+                img, regionRoutine.intFind.findFilteredMask, True, 10
+            ).ravel()
 
             # drug?
             # continue if no coefficients
@@ -68,18 +68,20 @@ class pls:
             # start with offst
             pls_concentration = drug_coeff[0]
 
-            coeff_index = 1
+            if len(drug_coeff) < features.size + 1:
+                raise Exception(
+                    f"Expected {features.size} coefficients for {drug.lower()}, "
+                    f"found {len(drug_coeff) - 1}."
+                )
 
-            for letter in ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L"]:
-                for region in range(10):
-                    for color_letter in ["R", "G", "B"]:
-                        pixval = f[letter + str(region + 1) + "-" + color_letter]
-                        pls_concentration += float(pixval) * drug_coeff[coeff_index]
-                        coeff_index += 1
+            # accumulate in order so results match the per-column sum
+            for pixval, coeff in zip(features.tolist(), drug_coeff[1:]):
+                pls_concentration += float(pixval) * coeff
 
             return pls_concentration
         except Exception as e:
-            print("Error", e, "pls analyzing image", in_file, "with", drug)
+            name = in_file if isinstance(in_file, str) else type(in_file).__name__
+            print("Error", e, "pls analyzing image", name, "with", drug)
             return -1.0
 
 
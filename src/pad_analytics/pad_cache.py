@@ -0,0 +1,188 @@
+"""Persistent cache of PAD API metadata responses.
+
+The JSON behind get_projects, get_card_by_id, get_models/get_model and
+get_card_issues is kept in a SQLite database under the cache directory
+(PAD_CACHE_DIR, default ~/.cache/pad_analytics), so repeated notebook
+sessions and batch reruns do not fetch unchanged metadata again. Each
+resource has its own time-to-live; invalidate() drops entries explicitly.
+In offline mode (configure(offline=True) or PAD_OFFLINE=1) cached entries
+are returned whatever their age and nothing is fetched. An unusable cache
+(unwritable directory, locked database) only warns: lookups miss and
+stores are skipped, so requests go on uncached.
+"""
+
+import contextlib
+import json
+import os
+import sqlite3
+import time
+import warnings
+
+# Seconds an entry stays fresh, per resource. None never expires, 0 turns
+# caching off for the resource.
+DEFAULT_TTLS = {
+    "projects": 60 * 60,
+    "cards": 24 * 60 * 60,
+    "models": 24 * 60 * 60,
+    "card_issues": 7 * 24 * 60 * 60,
+}
+DB_NAME = "metadata.sqlite"
+
+_config = {
+    "cache_dir": None,
+    "ttls": dict(DEFAULT_TTLS),
+    "enabled": True,
+    "offline": None,
+}
+# Invalidations per resource in this process (None: all resources), so
+# in-memory views such as the project catalog know to reload
+_generations = {}
+
+
+def configure(cache_dir=None, ttls=None, enabled=None, offline=None):
+    """
+    Change the cache settings.
+
+    Parameters:
+    -----------
+    cache_dir : str
+        Directory holding the cache database
+    ttls : dict
+        {resource: seconds} overriding DEFAULT_TTLS
+    enabled : bool
+        Turn the cache on or off
+    offline : bool
+        Serve cached entries regardless of age and never fetch
+    """
+    if cache_dir is not None:
+        _config["cache_dir"] = cache_dir
+    if ttls is not None:
+        _config["ttls"].update(ttls)
+    if enabled is not None:
+        _config["enabled"] = enabled
+    if offline is not None:
+        _config["offline"] = offline
+
+
+def cache_dir():
+    """Return the directory of the cache database."""
+    if _config["cache_dir"] is not None:
+        return _config["cache_dir"]
+    default = os.path.join(os.path.expanduser("~"), ".cache", "pad_analytics")
+    return os.getenv("PAD_CACHE_DIR", default)
+
+
+def is_enabled():
+    """Return True when the cache is on."""
+    return _config["enabled"]
+
+
+def ttl(resource):
+    """Seconds entries of resource stay fresh (None: never expire)."""
+    return _config["ttls"].get(resource)
+
+
+def is_offline():
+    """Return True when requests must be served from the cache only."""
+    if _config["offline"] is not None:
+        return _config["offline"]
+    return os.getenv("PAD_OFFLINE", "").lower() in ("1", "true", "yes")
+
+
+def lookup(url, resource):
+    """
+    Return the cached JSON for url, or None when it is missing or expired.
+    In offline mode expired entries are returned too.
+    """
+    ttl = _config["ttls"].get(resource)
+    if not _config["enabled"] or ttl == 0:
+        return None
+    try:
+        with _connect() as db:
+            row = db.execute(
+                "SELECT fetched, body FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+    except (sqlite3.Error, OSError) as e:
+        _warn(e)
+        return None
+    if row is None:
+        return None
+    fetched, body = row
+    if not is_offline() and ttl is not None and time.time() - fetched > ttl:
+        return None
+    return json.loads(body)
+
+
+def store(url, resource, data):
+    """Cache the JSON data fetched from url under resource."""
+    if not _config["enabled"] or _config["ttls"].get(resource) == 0:
+        return
+    try:
+        with _connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses (url, resource, fetched, body) "
+                "VALUES (?, ?, ?, ?)",
+                (url, resource, time.time(), json.dumps(data)),
+            )
+    except (sqlite3.Error, OSError) as e:
+        _warn(e)
+
+
+def invalidate(resource=None, url=None):
+    """
+    Drop cached entries: the one for url, every entry of resource, or
+    everything when neither is given. Returns the number of entries dropped.
+    """
+    query, args = "DELETE FROM responses", ()
+    if url is not None:
+        query, args = query + " WHERE url = ?", (url,)
+    elif resource is not None:
+        query, args = query + " WHERE resource = ?", (resource,)
+    # An entry dropped by url may belong to any resource
+    key = resource if url is None else None
+    _generations[key] = _generations.get(key, 0) + 1
+    with _connect() as db:
+        return db.execute(query, args).rowcount
+
+
+def generation(resource):
+    """Number of invalidations of resource so far in this process."""
+    return _generations.get(resource, 0) + _generations.get(None, 0)
+
+
+def fetched(url):
+    """Time the cached entry of url was fetched, or None when not cached."""
+    if not _config["enabled"]:
+        return None
+    try:
+        with _connect() as db:
+            row = db.execute(
+                "SELECT fetched FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+    except (sqlite3.Error, OSError) as e:
+        _warn(e)
+        return None
+    return None if row is None else row[0]
+
+
+def _warn(error):
+    warnings.warn(f"PAD metadata cache unavailable, continuing uncached: {error}")
+
+
+@contextlib.contextmanager
+def _connect():
+    # A short-lived connection per call keeps the cache safe to use from
+    # several threads and processes; WAL lets readers run during writes.
+    directory = cache_dir()
+    os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(os.path.join(directory, DB_NAME), timeout=30)
+    try:
+        with db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "url TEXT PRIMARY KEY, resource TEXT, fetched REAL, body TEXT)"
+            )
+            yield db
+    finally:
+        db.close()
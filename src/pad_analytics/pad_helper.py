@@ -2,6 +2,8 @@
 import requests
 import base64
 
+from . import pad_session
+
 
 # api-endpoint location
 URL = "https://pad.crc.nd.edu/index.php?option=com_jbackend&view=request&module=querytojson&resource=list&action=get"
@@ -24,7 +26,7 @@ def query_pad_database(project_name, api_key):
 
     # sending get request and saving the response as response object
     try:
-        r = requests.get(url=URL, params=PARAMS)
+        r = pad_session.get(URL, params=PARAMS)
 
         # extracting data in json format
         jdata = r.json()
@@ -39,7 +41,6 @@ def query_pad_database(project_name, api_key):
     # helper function to download from pad server
 
 
-import urllib.request
 import os
 
 
@@ -53,7 +54,11 @@ def pad_download(url, file_name=None):
             file_name = os.path.basename(url)
 
         # download
-        result = urllib.request.urlretrieve(url, file_name)
+        response = pad_session.get(url, stream=True)
+        response.raise_for_status()
+        with open(file_name, "wb") as f:
+            for chunk in response.iter_content(64 * 1024):
+                f.write(chunk)
         return True
     except Exception as e:
         # flag if failed
@@ -0,0 +1,224 @@
+"""Shared on-disk cache of downloaded card images.
+
+Images are stored once per content hash under <pad_cache.cache_dir()>/images
+and indexed by URL in a SQLite database, so the same processed PNGs are not
+downloaded again across runs, notebooks and processes. Blobs are written to
+a temporary file and renamed into place, so readers never see a partial
+image. When the cache grows past its size cap the least recently used URLs
+are evicted. In pad_cache offline mode misses raise instead of downloading.
+An unusable cache directory or database only warns, and images are then
+downloaded without caching.
+"""
+
+import contextlib
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import warnings
+
+from . import pad_cache
+from . import pad_session
+
+DEFAULT_MAX_BYTES = 2 * 1024**3
+DB_NAME = "images.sqlite"
+
+_config = {"max_bytes": DEFAULT_MAX_BYTES, "enabled": True}
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_stats_lock = threading.Lock()
+
+
+def configure(max_bytes=None, enabled=None):
+    """
+    Change the image cache settings.
+
+    Parameters:
+    -----------
+    max_bytes : int
+        Size cap of the cached images; least recently used ones are evicted
+    enabled : bool
+        Turn the cache on or off
+    """
+    if max_bytes is not None:
+        _config["max_bytes"] = max_bytes
+    if enabled is not None:
+        _config["enabled"] = enabled
+
+
+def image_dir():
+    """Return the directory holding the cached images."""
+    return os.path.join(pad_cache.cache_dir(), "images")
+
+
+def get_bytes(url, fetch=None, **request_kwargs):
+    """
+    Return the content at url, from the cache when present.
+
+    Parameters:
+    -----------
+    url : str
+        Image URL, also the cache key
+    fetch : callable
+        fetch(url) -> bytes used on a miss; defaults to a GET on the shared
+        pad_session with request_kwargs, raising for HTTP errors
+    """
+    if not _config["enabled"]:
+        return _download(url, fetch, request_kwargs)
+    try:
+        data = _lookup(url)
+    except (sqlite3.Error, OSError) as e:
+        _warn(e)
+        return _download(url, fetch, request_kwargs)
+    if data is not None:
+        _count("hits")
+        return data
+    _count("misses")
+    if pad_cache.is_offline():
+        raise LookupError(f"{url} is not cached and offline mode is on")
+    data = _download(url, fetch, request_kwargs)
+    try:
+        _store(url, data)
+    except (sqlite3.Error, OSError) as e:
+        _warn(e)
+    return data
+
+
+def stats():
+    """Hits, misses and evictions of this process, and the cache size."""
+    with _connect() as db:
+        entries, size = db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM images"
+        ).fetchone()
+    with _stats_lock:
+        result = dict(_stats)
+    result.update(entries=entries, bytes=size, max_bytes=_config["max_bytes"])
+    return result
+
+
+def invalidate(url=None):
+    """Drop the entry of url, or every entry. Returns the number dropped."""
+    with _connect() as db:
+        if url is None:
+            rows = db.execute("SELECT digest FROM images").fetchall()
+            db.execute("DELETE FROM images")
+        else:
+            rows = db.execute(
+                "SELECT digest FROM images WHERE url = ?", (url,)
+            ).fetchall()
+            db.execute("DELETE FROM images WHERE url = ?", (url,))
+        _remove_orphans(db, {digest for (digest,) in rows})
+    return len(rows)
+
+
+def _download(url, fetch, request_kwargs):
+    if fetch is not None:
+        return fetch(url)
+    response = pad_session.get(url, **request_kwargs)
+    response.raise_for_status()
+    return response.content
+
+
+def _lookup(url):
+    with _connect() as db:
+        row = db.execute(
+            "SELECT digest, size FROM images WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        db.execute("UPDATE images SET accessed = ? WHERE url = ?", (time.time(), url))
+    digest, size = row
+    try:
+        with open(_blob_path(digest), "rb") as handle:
+            data = handle.read()
+    except FileNotFoundError:
+        # Evicted by another process between the lookup and the read
+        return None
+    return data if len(data) == size else None
+
+
+def _store(url, data):
+    digest = hashlib.sha256(data).hexdigest()
+    path = _blob_path(digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as blob:
+                blob.write(data)
+            os.replace(temp, path)
+        except BaseException:
+            if os.path.exists(temp):
+                os.unlink(temp)
+            raise
+    with _connect() as db:
+        old = db.execute("SELECT digest FROM images WHERE url = ?", (url,)).fetchone()
+        db.execute(
+            "INSERT OR REPLACE INTO images (url, digest, size, accessed) "
+            "VALUES (?, ?, ?, ?)",
+            (url, digest, len(data), time.time()),
+        )
+        if old is not None and old[0] != digest:
+            _remove_orphans(db, {old[0]})
+        _evict(db)
+
+
+def _evict(db):
+    (total,) = db.execute("SELECT COALESCE(SUM(size), 0) FROM images").fetchone()
+    if total <= _config["max_bytes"]:
+        return
+    evicted = set()
+    for url, digest, size in db.execute(
+        "SELECT url, digest, size FROM images ORDER BY accessed"
+    ).fetchall():
+        if total <= _config["max_bytes"]:
+            break
+        db.execute("DELETE FROM images WHERE url = ?", (url,))
+        evicted.add(digest)
+        total -= size
+        _count("evictions")
+    _remove_orphans(db, evicted)
+
+
+def _remove_orphans(db, digests):
+    # A blob may be shared by several URLs with identical content
+    for digest in digests:
+        (users,) = db.execute(
+            "SELECT COUNT(*) FROM images WHERE digest = ?", (digest,)
+        ).fetchone()
+        if users == 0:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(_blob_path(digest))
+
+
+def _blob_path(digest):
+    return os.path.join(image_dir(), digest[:2], digest)
+
+
+def _warn(error):
+    warnings.warn(f"PAD image cache unavailable, continuing uncached: {error}")
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+@contextlib.contextmanager
+def _connect():
+    # Same short-lived WAL connections as pad_cache; writers serialize on
+    # the database lock, so index updates and evictions are atomic.
+    directory = image_dir()
+    os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(os.path.join(directory, DB_NAME), timeout=30)
+    try:
+        with db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS images ("
+                "url TEXT PRIMARY KEY, digest TEXT, size INTEGER, accessed REAL)"
+            )
+            yield db
+    finally:
+        db.close()
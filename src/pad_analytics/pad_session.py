@@ -0,0 +1,107 @@
+"""Shared HTTP session for every PAD API and image request.
+
+All network calls in padanalytics and pad_helper go through get(), so they
+reuse one requests.Session with a sized keep-alive connection pool instead
+of paying a new TCP+TLS handshake per call. Idempotent requests are retried
+with exponential backoff on connection errors and on 429/5xx responses, and
+every call gets a default timeout. Use configure() to change the settings.
+"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (10, 60)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_config = {
+    "pool_size": DEFAULT_POOL_SIZE,
+    "retries": DEFAULT_RETRIES,
+    "backoff": DEFAULT_BACKOFF,
+    "timeout": DEFAULT_TIMEOUT,
+}
+_session = None
+_lock = threading.Lock()
+
+
+def configure(pool_size=None, retries=None, backoff=None, timeout=None):
+    """
+    Change the settings of the shared session.
+
+    Parameters:
+    -----------
+    pool_size : int
+        Connections kept alive per host; size it to the number of threads
+        making requests at once
+    retries : int
+        Retries of a failed GET before giving up
+    backoff : float
+        Backoff factor in seconds; retry n waits backoff * 2 ** (n - 1)
+    timeout : float or (float, float)
+        Default (connect, read) timeout of every request
+
+    The current session is closed and a new one is created on next use.
+    """
+    updates = {
+        "pool_size": pool_size,
+        "retries": retries,
+        "backoff": backoff,
+        "timeout": timeout,
+    }
+    with _lock:
+        _config.update((k, v) for k, v in updates.items() if v is not None)
+        _close_locked()
+
+
+def get_session():
+    """Return the shared requests.Session, creating it on first use."""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = _new_session()
+        return _session
+
+
+def get(url, **kwargs):
+    """requests.get through the shared session, with the default timeout."""
+    kwargs.setdefault("timeout", _config["timeout"])
+    return get_session().get(url, **kwargs)
+
+
+def close():
+    """Close the shared session and its pooled connections."""
+    with _lock:
+        _close_locked()
+
+
+def _close_locked():
+    global _session
+    if _session is not None:
+        _session.close()
+        _session = None
+
+
+def _new_session():
+    retry = Retry(
+        total=_config["retries"],
+        backoff_factor=_config["backoff"],
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        # Hand the last response back so callers still see its status code
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=_config["pool_size"],
+        pool_maxsize=_config["pool_size"],
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -2,7 +2,13 @@ import requests, os
 import urllib3
 import warnings
 import sys
+import asyncio
+import codecs
 import contextlib
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageFile
 import ipywidgets as widgets
 from IPython.display import display, HTML
@@ -11,10 +17,12 @@ import io
 import pandas as pd
 import tensorflow as tf
 from sklearn.metrics import mean_squared_error
-import tempfile
 
 from . import regionRoutine
 from . import pad_helper
+from . import pad_session
+from . import pad_cache
+from . import pad_image_cache
 import numpy as np
 import csv
 import cv2 as cv
@@ -107,32 +115,245 @@ def _get_mapping_file_path():
 MODEL_DATASET_MAPPING = _get_mapping_file_path()
 
 
-def get_data_api(request_url, data_type=""):
+def _get_json(request_url, data_type="", resource=None):
+    """Return the JSON at request_url, or None (after printing why) on error."""
+    # Metadata resources are served from pad_cache while fresh
+    if resource is not None:
+        data = pad_cache.lookup(request_url, resource)
+        if data is not None:
+            return data
+    if pad_cache.is_offline():
+        print(f"Error accessing {data_type} data: not cached and offline mode is on")
+        return None
     try:
         # fetch_data_from_api
-        r = requests.get(
+        r = pad_session.get(
             url=request_url, verify=False
         )  # NOTE: Using verify=False due to a SSL issue, I need a valid certificate, then I will remove this parameter.
         r.raise_for_status()  # Raise an exception if the status is not 200
         data = r.json()
-        df = pd.json_normalize(data)
-        return df
+        if resource is not None:
+            pad_cache.store(request_url, resource, data)
+        return data
     except requests.exceptions.RequestException as e:
         print(e)
-        print(f"Error accessing {data_type} data: {r.status_code}")
+        status_code = getattr(e.response, "status_code", None)
+        print(f"Error accessing {data_type} data: {status_code}")
         return None
 
 
+def get_data_api(request_url, data_type="", resource=None):
+    data = _get_json(request_url, data_type, resource)
+    if data is None:
+        return None
+    df = pd.json_normalize(data)
+    return df
+
+
+def iter_data_api(request_url, data_type="", chunk_size=1000, schema=None):
+    """
+    Stream a JSON array from the API as DataFrame chunks
+
+    The response is parsed incrementally and normalized chunk_size records
+    at a time, so memory stays bounded by the chunk size rather than the
+    payload size. Nothing is cached.
+
+    Parameters:
+    -----------
+    request_url : str
+        API URL returning a JSON array (a single object yields one chunk)
+    data_type : str
+        Name used in error messages
+    chunk_size : int
+        Records per chunk
+    schema : dict
+        {column: dtype} every chunk is conformed to: missing columns are
+        added as NA, others dropped, and dtypes cast. Without a schema it is
+        taken from the first chunk, using pandas nullable dtypes with id
+        columns (id, *.id, *_id) as Int64 and other numbers as Float64; a
+        later chunk with a column it does not list then raises ValueError
+        rather than losing data. Pass a schema when the first chunk may not
+        show every column (e.g. a nested field null in it).
+
+    Yields:
+    -------
+    pandas.DataFrame
+        Chunks of at most chunk_size rows with identical columns and dtypes
+    """
+    r = pad_session.get(url=request_url, verify=False, stream=True)
+    try:
+        r.raise_for_status()
+        inferred = schema is None
+        chunk = []
+        for record in _iter_json_array(r.iter_content(64 * 1024)):
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                df, schema = _conform_chunk(pd.json_normalize(chunk), schema, inferred)
+                chunk = []
+                yield df
+        if chunk:
+            df, schema = _conform_chunk(pd.json_normalize(chunk), schema, inferred)
+            yield df
+    except requests.exceptions.RequestException as e:
+        print(e)
+        status_code = getattr(e.response, "status_code", None)
+        raise Exception(f"Error accessing {data_type} data: {status_code}") from e
+    finally:
+        r.close()
+
+
+def save_data_api(request_url, path, data_type="", chunk_size=1000, schema=None):
+    """
+    Stream a JSON array from the API into a file, chunk by chunk
+
+    Chunks from iter_data_api are appended to path: a Parquet file when path
+    ends in .parquet (requires pyarrow), a CSV file otherwise. Returns the
+    number of rows written.
+    """
+    rows = 0
+    writer = None
+    try:
+        for df in iter_data_api(request_url, data_type, chunk_size, schema):
+            if path.endswith(".parquet"):
+                if writer is None:
+                    try:
+                        import pyarrow
+                        import pyarrow.parquet
+                    except ImportError:
+                        raise ImportError("Writing .parquet files requires pyarrow")
+                    table = pyarrow.Table.from_pandas(df, preserve_index=False)
+                    writer = pyarrow.parquet.ParquetWriter(path, table.schema)
+                else:
+                    table = pyarrow.Table.from_pandas(
+                        df, schema=writer.schema, preserve_index=False
+                    )
+                writer.write_table(table)
+            else:
+                first = rows == 0
+                df.to_csv(path, mode="w" if first else "a", header=first, index=False)
+            rows += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def iter_project_cards(project_id, chunk_size=1000, schema=None):
+    """Stream the cards of one project as DataFrame chunks (see iter_data_api)."""
+    request_url = f"{API_URL}/projects/{project_id}/cards"
+    return iter_data_api(request_url, f"project {project_id} cards", chunk_size, schema)
+
+
+_NUMBER_CHARS = "0123456789.eE+-"
+
+
+def _iter_json_array(chunks):
+    """
+    Yield the elements of a JSON array read from an iterable of byte chunks,
+    decoding one element at a time. A top-level object is yielded whole.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    position = 0
+    started = False
+    done = False
+
+    def skip(chars):
+        nonlocal position
+        while position < len(buffer) and buffer[position] in chars:
+            position += 1
+
+    while True:
+        skip(" \t\r\n")
+        if not started and position < len(buffer):
+            if buffer[position] == "{":
+                started = None  # a single object, decoded below
+            elif buffer[position] == "[":
+                started = True
+                position += 1
+                continue
+            else:
+                raise ValueError("API response is not a JSON array or object")
+        if started and position < len(buffer) and buffer[position] == "]":
+            return
+        if started and position < len(buffer) and buffer[position] == ",":
+            position += 1
+            continue
+        if position < len(buffer) and started is not False:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                # A value followed only by number characters may continue in
+                # the next chunk (e.g. "-25." then "5"), so only accept it
+                # once a delimiter or the end of the response has been seen
+                if done or buffer[end:].lstrip(_NUMBER_CHARS):
+                    position = end
+                    yield item
+                    if started is None:
+                        return
+                    continue
+            except json.JSONDecodeError:
+                if done:
+                    raise
+        if done:
+            if started is False and not buffer.strip():
+                return
+            raise ValueError("API response ended inside the JSON array")
+        # Need more data: drop what has been consumed and read a chunk
+        buffer = buffer[position:]
+        position = 0
+        data = next(chunks, None)
+        if data is None:
+            buffer += text.decode(b"", final=True)
+            done = True
+        else:
+            buffer += text.decode(data)
+
+
+def _conform_chunk(df, schema, inferred):
+    """
+    Cast df to schema ({column: dtype}, inferred from df when None). With an
+    inferred schema, columns it does not list raise instead of being dropped.
+    """
+    if schema is None:
+        # Integer ids stay Int64; other numbers are inferred as Float64
+        # since a later chunk may hold fractions. Columns with no values
+        # yet stay object
+        converted = df.convert_dtypes()
+        schema = {}
+        for column in df.columns:
+            dtype = converted[column].dtype
+            if df[column].isna().all():
+                dtype = object
+            elif pd.api.types.is_integer_dtype(dtype) and not _is_id(column):
+                dtype = "Float64"
+            schema[column] = dtype
+    unknown = [column for column in df.columns if column not in schema]
+    if inferred and unknown:
+        raise ValueError(
+            f"Chunk has columns not in the schema: {unknown}. "
+            "Pass an explicit schema to stream this response."
+        )
+    df = df.reindex(columns=list(schema))
+    return df.astype(schema), schema
+
+
+def _is_id(column):
+    name = column.rsplit(".", 1)[-1]
+    return name == "id" or name.endswith("_id")
+
+
 # Get card issue types
 def get_card_issues():
     request_url = f"{API_URL}/cards/issues"
-    return get_data_api(request_url, "card issues")
+    return get_data_api(request_url, "card issues", "card_issues")
 
 
 # Get projects
 def get_projects():
     request_url = f"{API_URL}/projects"
-    projects = get_data_api(request_url, "projects")
+    projects = get_data_api(request_url, "projects", "projects")
 
     # Find columns with all NaN values
     columns_with_all_nan = projects.columns[projects.isnull().all()]
@@ -173,20 +394,45 @@ def get_projects():
 
 
 # Extended function to get project cards for either a single project ID or multiple project IDs
-def get_project_cards(project_name=None, project_ids=None):
+def get_project_cards(
+    project_name=None, project_ids=None, concurrency=8, callback=None
+):
+    """
+    Fetch the cards of one or more projects.
+
+    Projects are requested concurrently, at most concurrency at a time on the
+    shared pad_session (keep it within the session pool size). Without a
+    callback the cards of all projects are normalized together in a single
+    pass, so every column has one consistent dtype, and returned as one
+    DataFrame. With callback, callback(project_id, cards_df) is called for
+    each project in order instead and nothing is kept; use it to stream
+    cards to a writer, e.g. df.to_csv(path, mode="a").
+    """
 
     def _get_project_cards_by_name(name):
-        project_id = get_project(name=project_name).id.values[0]
-        if project_id:
+        project_id = get_project_catalog().id_for(name)
+        if project_id is not None:
             return _get_project_cards_by_id(project_id)
         else:
             print(f"Project {name} not found.")
             return None
 
     # Get project cards
-    def _get_project_cards_by_id(project_id):
+    def _get_project_cards_json(project_id):
         request_url = f"{API_URL}/projects/{project_id}/cards"
-        return get_data_api(request_url, f"project {project_id} cards")
+        cards = _get_json(request_url, f"project {project_id} cards")
+        if cards is not None and not isinstance(cards, list):
+            cards = [cards]
+        return cards
+
+    def _get_project_cards_by_id(project_id):
+        cards = _get_project_cards_json(project_id)
+        if cards is None:
+            return None
+        if callback is not None:
+            callback(project_id, pd.json_normalize(cards))
+            return None
+        return pd.json_normalize(cards)
 
     # check if project_name is not None
     if project_name is not None:
@@ -205,24 +451,50 @@ def get_project_cards(project_name=None, project_ids=None):
             "project_ids must be a single integer, a list of integers, or None"
         )
 
-    all_cards = []  # List to hold dataframes from multiple projects
+    all_cards = []  # Card records from all projects
+    retrieved = False
 
-    for project_id in project_ids:
-        # Get cards for each project
-        project_cards = _get_project_cards_by_id(project_id)
+    for project_id, cards in _map_in_order(
+        _get_project_cards_json, project_ids, concurrency
+    ):
+        if cards is None:
+            continue
+        retrieved = True
+        if callback is not None:
+            callback(project_id, pd.json_normalize(cards))
+        else:
+            all_cards.extend(cards)
 
-        if project_cards is not None:
-            all_cards.append(project_cards)
+    if callback is not None:
+        return None
 
-    # Concatenate all dataframes into one, if there is data
-    if all_cards:
-        combined_df = pd.concat(all_cards, ignore_index=True)
+    # Normalize all projects at once, if there is data
+    if retrieved:
+        combined_df = pd.json_normalize(all_cards)
         return combined_df
     else:
         print("No data was retrieved for the provided project IDs.")
         return None
 
 
+def _map_in_order(func, items, concurrency):
+    """
+    Yield (item, func(item)) for every item, in order, running func in up to
+    concurrency threads with at most 2 * concurrency calls in flight.
+    """
+    concurrency = max(1, concurrency)
+    with ThreadPoolExecutor(concurrency) as executor:
+        pending = deque()
+        for item in items:
+            pending.append((item, executor.submit(func, item)))
+            if len(pending) >= 2 * concurrency:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+
 # def get_card(card_id):
 #     request_url = f"{API_URL}/cards/{card_id}"
 #     return get_data_api(request_url, f"card {card_id}")
@@ -230,7 +502,79 @@ def get_project_cards(project_name=None, project_ids=None):
 
 def get_card_by_id(card_id):
     request_url = f"{API_URL}/cards/{card_id}"
-    return get_data_api(request_url, f"card {card_id}")
+    return get_data_api(request_url, f"card {card_id}", "cards")
+
+
+def _fetch_card_json(card_id):
+    """Return the JSON of one card, from pad_cache when fresh."""
+    request_url = f"{API_URL}/cards/{card_id}"
+    data = pad_cache.lookup(request_url, "cards")
+    if data is None:
+        if pad_cache.is_offline():
+            raise LookupError("not cached and offline mode is on")
+        r = pad_session.get(request_url, verify=False)
+        r.raise_for_status()
+        data = r.json()
+        pad_cache.store(request_url, "cards", data)
+    return data
+
+
+async def get_cards_async(card_ids, concurrency=16):
+    """
+    Fetch many cards concurrently; the awaitable form of get_cards.
+
+    Requests run on the shared pad_session in worker threads, at most
+    concurrency at a time. Keep concurrency within the session pool size
+    (pad_session.configure(pool_size=...)) so connections are reused.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    executor = ThreadPoolExecutor(concurrency)
+
+    async def fetch(card_id):
+        async with semaphore:
+            try:
+                data = await loop.run_in_executor(executor, _fetch_card_json, card_id)
+                return card_id, data, None
+            except Exception as e:
+                return card_id, None, str(e)
+
+    try:
+        results = await asyncio.gather(*(fetch(card_id) for card_id in card_ids))
+    finally:
+        executor.shutdown(wait=False)
+
+    cards = [data for _, data, error in results if error is None]
+    errors = {card_id: error for card_id, _, error in results if error is not None}
+    cards_df = pd.json_normalize(cards) if cards else pd.DataFrame()
+    return cards_df, errors
+
+
+def get_cards(card_ids, concurrency=16):
+    """
+    Fetch the metadata of many cards at once.
+
+    Parameters:
+    -----------
+    card_ids : list of int
+        The card IDs to fetch
+    concurrency : int
+        Maximum number of requests in flight
+
+    Returns:
+    --------
+    (pandas.DataFrame, dict)
+        One row per card fetched, in the order of card_ids, normalized in a
+        single pass, and {card_id: error message} for the cards that failed
+    """
+    coroutine = get_cards_async(list(card_ids), concurrency)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    # Called from a running event loop (e.g. a notebook): run on a thread
+    with ThreadPoolExecutor(1) as runner:
+        return runner.submit(asyncio.run, coroutine).result()
 
 
 def get_card(card_id=None, sample_id=None):
@@ -251,11 +595,95 @@ def get_project_by_id(project_id):
 
 
 def get_project_by_name(project_name):
-    projects = get_projects()
-    project = projects[
-        projects["project_name"].apply(lambda x: x.lower() == project_name.lower())
-    ]
-    return project
+    return get_project_catalog().by_name(project_name)
+
+
+class ProjectCatalog:
+    """
+    The project list with case-insensitive name and id indexes.
+
+    The list comes from get_projects() (itself backed by pad_cache) and is
+    loaded on first use, then reloaded and reindexed once it is older than
+    ttl seconds, so lookups in loops are dictionary hits. Without a ttl the
+    "projects" TTL of pad_cache applies (the default one while that cache is
+    off), and invalidating its projects reloads the list too. The age counts
+    from when pad_cache fetched the list, so the two TTLs do not add up.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        # (projects, name -> positions, id -> position, fetch time,
+        # pad_cache generation), swapped as a whole so lookups never mix
+        # two versions of the list
+        self._state = None
+
+    @property
+    def projects(self):
+        """The full project list as returned by get_projects()."""
+        return self._current()[0]
+
+    def refresh(self):
+        """Reload the project list and rebuild the indexes now."""
+        generation = pad_cache.generation("projects")
+        projects = get_projects()
+        fetched = None
+        if not pad_cache.is_offline():
+            fetched = pad_cache.fetched(f"{API_URL}/projects")
+        if fetched is None:
+            fetched = time.time()
+        by_name = {}
+        for position, name in enumerate(projects["project_name"]):
+            if isinstance(name, str):
+                by_name.setdefault(name.lower(), []).append(position)
+        by_id = {
+            project_id: position for position, project_id in enumerate(projects["id"])
+        }
+        self._state = (projects, by_name, by_id, fetched, generation)
+        return self._state
+
+    def by_name(self, project_name):
+        """Rows of the projects named project_name, ignoring case."""
+        projects, by_name, _, _, _ = self._current()
+        return projects.iloc[by_name.get(project_name.lower(), [])]
+
+    def by_id(self, project_id):
+        """Row of the project with this id (empty when unknown)."""
+        projects, _, by_id, _, _ = self._current()
+        position = by_id.get(project_id)
+        return projects.iloc[[] if position is None else [position]]
+
+    def id_for(self, project_name):
+        """Id of the first project named project_name, or None."""
+        projects, by_name, _, _, _ = self._current()
+        positions = by_name.get(project_name.lower())
+        if not positions:
+            return None
+        return projects["id"].iloc[positions[0]]
+
+    def _current(self):
+        state = self._state
+        if state is None or self._stale(state):
+            state = self.refresh()
+        return state
+
+    def _stale(self, state):
+        if state[4] != pad_cache.generation("projects"):
+            return True
+        ttl = self.ttl
+        if ttl is None:
+            ttl = pad_cache.ttl("projects") if pad_cache.is_enabled() else 0
+            if ttl == 0:
+                # Without a projects cache the catalog still keeps the list
+                ttl = pad_cache.DEFAULT_TTLS["projects"]
+        return ttl is not None and time.time() - state[3] >= ttl
+
+
+_project_catalog = ProjectCatalog()
+
+
+def get_project_catalog():
+    """Return the shared ProjectCatalog."""
+    return _project_catalog
 
 
 def get_project(id=None, name=None):
@@ -271,8 +699,8 @@ def get_project(id=None, name=None):
 
 # Function to load image from URL
 def load_image_from_url(image_url):
-    response = requests.get(image_url)
-    img = Image.open(io.BytesIO(response.content))
+    content = pad_image_cache.get_bytes(image_url)
+    img = Image.open(io.BytesIO(content))
     return img
 
 
@@ -539,8 +967,8 @@ def show_grouped_cards(df, group_column, images_per_row=5):
 
 
 def create_thumbnail(url, size=(100, 100)):
-    response = requests.get(url)
-    img = Image.open(BytesIO(response.content))
+    content = pad_image_cache.get_bytes(url)
+    img = Image.open(BytesIO(content))
     img.thumbnail(size)
     return img
     # create_thumbnail('https://pad.crc.nd.edu//var/www/html/images/padimages/processed/40000/42275_processed.png', size=(100, 100))
@@ -550,7 +978,63 @@ def standardize_names(name):
     return name.lower().replace(" ", "-")
 
 
-# Extended function to get project cards for either a single project ID or multiple project IDs
+# Output columns of get_card_by_sample_id: (column, source path in the
+# normalized API payload, or None for a column the API does not provide,
+# default value)
+_SAMPLE_CARD_FIELDS = [
+    ("id", "id", None),
+    ("sample_name", "sample_name.name", None),
+    ("test_name", "test_name.name", None),
+    ("user_name", "user_name.name", None),
+    ("date_of_creation", "date_of_creation", None),
+    ("raw_file_location", "raw_file_location", None),
+    ("processed_file_location", "processed_file_location", None),
+    ("processing_date", None, None),  # This field wasn't in the original data
+    ("camera_type_1", "camera_type_1", None),
+    ("notes", "notes", None),
+    ("sample_id", "sample_id", None),
+    ("quantity", "quantity", None),
+    ("deleted", None, False),  # This field wasn't in the original data
+    ("issue", "issue_id", None),
+    ("project.id", "project.id", None),
+    ("project.user_name", None, None),  # Not in the project data
+    ("project.project_name", "project.name", None),
+    ("project.annotation", None, None),
+    ("project.test_name", None, None),
+    ("project.sample_names.sample_names", None, None),
+    ("project.neutral_filler", None, None),
+    ("project.qpc20", None, None),
+    ("project.qpc50", None, None),
+    ("project.qpc80", None, None),
+    ("project.qpc100", None, None),
+    ("project.notes", None, None),
+]
+
+
+def _fetch_sample_cards(sample_id):
+    """Return the list of card payloads of one sample."""
+    url = f"https://pad.crc.nd.edu/api-ld/v3/cards/by-sample/{sample_id}"
+    response = pad_session.get(url)
+    data = response.json()
+
+    if not data["success"]:
+        raise Exception(f"API request failed: {data['error']}")
+
+    return data["data"]
+
+
+def _flatten_sample_cards(cards):
+    """Flatten card payloads into the get_card_by_sample_id columns at once."""
+    flat = pd.json_normalize(cards)
+    df = pd.DataFrame(index=flat.index)
+    for column, source, default in _SAMPLE_CARD_FIELDS:
+        if source is not None and source in flat.columns:
+            df[column] = flat[source]
+        else:
+            df[column] = default
+    return df
+
+
 def get_card_by_sample_id(sample_id):
     """
     Fetches card data for a given sample_id and returns it as a pandas DataFrame
@@ -565,55 +1049,44 @@ def get_card_by_sample_id(sample_id):
     pandas.DataFrame
         DataFrame containing the card information with specified columns
     """
+    return _flatten_sample_cards(_fetch_sample_cards(sample_id))
 
-    # Make API request
-    url = f"https://pad.crc.nd.edu/api-ld/v3/cards/by-sample/{sample_id}"
-    response = requests.get(url)
-    data = response.json()
 
-    if not data["success"]:
-        raise Exception(f"API request failed: {data['error']}")
+def get_cards_by_sample_ids(sample_ids, concurrency=8):
+    """
+    Fetches the cards of many samples concurrently
 
-    # Extract cards data
-    cards = data["data"]
-
-    # Process each card to flatten the nested structure
-    processed_cards = []
-    for card in cards:
-        processed_card = {
-            "id": card["id"],
-            "sample_name": card["sample_name"]["name"],
-            "test_name": card["test_name"]["name"],
-            "user_name": card["user_name"]["name"],
-            "date_of_creation": card["date_of_creation"],
-            "raw_file_location": card["raw_file_location"],
-            "processed_file_location": card["processed_file_location"],
-            "processing_date": None,  # This field wasn't in the original data
-            "camera_type_1": card["camera_type_1"],
-            "notes": card["notes"],
-            "sample_id": card["sample_id"],
-            "quantity": card["quantity"],
-            "deleted": False,  # This field wasn't in the original data
-            "issue": card.get("issue_id"),
-            "project.id": card["project"]["id"],
-            "project.user_name": None,  # This field wasn't in the project data
-            "project.project_name": card["project"]["name"],
-            "project.annotation": None,  # This field wasn't in the project data
-            "project.test_name": None,  # This field wasn't in the project data
-            "project.sample_names.sample_names": None,  # This field wasn't in the project data
-            "project.neutral_filler": None,  # This field wasn't in the project data
-            "project.qpc20": None,  # This field wasn't in the project data
-            "project.qpc50": None,  # This field wasn't in the project data
-            "project.qpc80": None,  # This field wasn't in the project data
-            "project.qpc100": None,  # This field wasn't in the project data
-            "project.notes": None,  # This field wasn't in the project data
-        }
-        processed_cards.append(processed_card)
+    Parameters:
+    -----------
+    sample_ids : list of int
+        The sample IDs to fetch cards for
+    concurrency : int
+        Maximum number of requests in flight
 
-    # Create DataFrame
-    df = pd.DataFrame(processed_cards)
+    Returns:
+    --------
+    (pandas.DataFrame, dict)
+        The cards of all samples, in sample order, with the columns of
+        get_card_by_sample_id, and {sample_id: error message} for the
+        samples that could not be fetched
+    """
 
-    return df
+    def fetch(sample_id):
+        try:
+            return _fetch_sample_cards(sample_id), None
+        except Exception as e:
+            return None, str(e)
+
+    cards = []
+    errors = {}
+    for sample_id, (sample_cards, error) in _map_in_order(
+        fetch, sample_ids, concurrency
+    ):
+        if error is not None:
+            errors[sample_id] = error
+        else:
+            cards.extend(sample_cards)
+    return _flatten_sample_cards(cards), errors
 
 
 def show_cards_from_df(cards_df):
@@ -761,42 +1234,41 @@ def show_cards(card_ids):
 
 def get_models():
     request_url = f"{API_URL}/neural-networks"
-    return get_data_api(request_url, "card issues")
+    return get_data_api(request_url, "card issues", "models")
 
 
 def get_model(nn_id):
     request_url = f"{API_URL}/neural-networks/{nn_id}"
-    return get_data_api(request_url, f"neural_network {nn_id}")
+    return get_data_api(request_url, f"neural_network {nn_id}", "models")
 
 
 def read_img(image_url):
-    # Get the image data from the URL
-    response = requests.get(image_url)
-    response.raise_for_status()  # Ensure the request was successful
+    # Get the image data from the URL (raises if the request failed)
+    content = pad_image_cache.get_bytes(image_url)
 
-    # Open the image using PIL directly from the HTTP response
-    img = Image.open(BytesIO(response.content))
+    # Open the image using PIL directly from the downloaded bytes
+    img = Image.open(BytesIO(content))
     return img
 
 
 def download_file(url, filename, images_path):
     """Download a file from a URL and save it to a local file."""
     try:
-        response = requests.get(url, stream=True, verify=False)
-        if response.status_code == 200:
-            path = os.path.join(images_path, filename)
-            with open(path, "wb") as f:
-                for chunk in response.iter_content(1024):
-                    f.write(chunk)
-            # print(f"File '{filename}' successfully downloaded to '{images_path}'")
-        else:
+        try:
+            content = pad_image_cache.get_bytes(url, verify=False)
+        except requests.exceptions.HTTPError as e:
             # Log error if the response status code is not 200
+            status_code = getattr(e.response, "status_code", None)
             print(
-                f"Failed to download the file. URL: {url} returned status code: {response.status_code}"
+                f"Failed to download the file. URL: {url} returned status code: {status_code}"
             )
             raise Exception(
-                f"Failed to download the file. URL: {url} returned status code: {response.status_code}"
+                f"Failed to download the file. URL: {url} returned status code: {status_code}"
             )
+        path = os.path.join(images_path, filename)
+        with open(path, "wb") as f:
+            f.write(content)
+        # print(f"File '{filename}' successfully downloaded to '{images_path}'")
     except Exception as e:
         # Log any other exceptions during the download process
         print(f"An error occurred while downloading the file: {e}")
@@ -826,24 +1298,21 @@ class pls:
             print("Error", e, "loading pls coefficients", coefficients_file)
 
     def quantity(self, in_file, drug):
+        """
+        PLS concentration of drug for a card given as a file path, encoded
+        image bytes or a BGR ndarray (see load_card_image).
+        """
         try:
             # grab image
-            img = cv.imread(in_file)
-
-            if img is None:
-                print("Converting img.. ", in_file)
-                # read image using Pillow and covert to cv2
-                img_pil = Image.open(in_file)
-                img = convert_from_image_to_cv2(img_pil)
+            img = load_card_image(in_file)
 
             if img is None:
                 raise Exception(f"Failed to load the file. URL: {in_file}.")
 
-            # pls dictionary
-            f = {}
-            f = regionRoutine.fullRoutine(
-                img, regionRoutine.intFind.findMaxIntensitiesFiltered, f, True, 10
-            )
+            # pls feature vector, in A1-R, A1-G, A1-B, A2-R, ... order
+            features = regionRoutine.extractFeatures(
+                img, regionRoutine.intFind.findFilteredMask, True, 10
+            ).ravel()
 
             # drug?
             # continue if no coefficients
@@ -857,30 +1326,64 @@ class pls:
             # start with offst
             pls_concentration = drug_coeff[0]
 
-            coeff_index = 1
+            if len(drug_coeff) < features.size + 1:
+                raise Exception(
+                    f"Expected {features.size} coefficients for {drug.lower()}, "
+                    f"found {len(drug_coeff) - 1}."
+                )
 
-            for letter in ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L"]:
-                for region in range(10):
-                    for color_letter in ["R", "G", "B"]:
-                        pixval = f[letter + str(region + 1) + "-" + color_letter]
-                        pls_concentration += float(pixval) * drug_coeff[coeff_index]
-                        coeff_index += 1
+            # accumulate in order so results match the per-column sum
+            for pixval, coeff in zip(features.tolist(), drug_coeff[1:]):
+                pls_concentration += float(pixval) * coeff
 
             # print(drug.lower(), "--- OK ---")
             return pls_concentration
 
         except Exception as e:
-            print("Error", e, "pls analyzing image", in_file, "with", drug)
+            name = _image_name(in_file)
+            print("Error", e, "pls analyzing image", name, "with", drug)
             return -1.0
 
 
+def load_card_image(source):
+    """
+    Return a card image as a BGR ndarray.
+
+    source is a file path, the encoded image bytes (decoded in memory with
+    cv.imdecode) or an ndarray, returned as is. Images OpenCV cannot decode
+    are read with Pillow instead.
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        img = cv.imdecode(np.frombuffer(source, dtype=np.uint8), cv.IMREAD_COLOR)
+        if img is None:
+            print("Converting img.. ", _image_name(source))
+            img = convert_from_image_to_cv2(Image.open(BytesIO(source)))
+        return img
+    img = cv.imread(source)
+    if img is None:
+        print("Converting img.. ", source)
+        # read image using Pillow and covert to cv2
+        img = convert_from_image_to_cv2(Image.open(source))
+    return img
+
+
+def _image_name(source):
+    """Short description of an image source for messages."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return f"<{len(source)} bytes>"
+    if isinstance(source, np.ndarray):
+        return f"<array {source.shape}>"
+    return source
+
+
 def read_img(image_url):
-    # Get the image data from the URL
-    response = requests.get(image_url)
-    response.raise_for_status()  # Ensure the request was successful
+    # Get the image data from the URL (raises if the request failed)
+    content = pad_image_cache.get_bytes(image_url)
 
-    # Open the image using PIL directly from the HTTP response
-    img = Image.open(BytesIO(response.content))
+    # Open the image using PIL directly from the downloaded bytes
+    img = Image.open(BytesIO(content))
     return img
 
 
@@ -945,7 +1448,12 @@ def nn_predict(image_url, model_path, labels):
     return prediction, probability, energy.numpy()
 
 
-def predict(card_id, model_id, actual_api=None, verbose=False):
+def predict(card_id, model_id, actual_api=None, verbose=False, use_cache=False):
+    """
+    Predict card_id with model_id; returns (actual_label, prediction).
+    PLS cards are fetched and decoded in memory; use_cache=True reads them
+    through pad_image_cache instead, which keeps them on disk.
+    """
 
     pad_url = "https://pad.crc.nd.edu/"
 
@@ -989,7 +1497,7 @@ def predict(card_id, model_id, actual_api=None, verbose=False):
         actual_label = actual_api
 
     # fix label names
-    labels = list(map(standardize_names, get_model(model_id).labels.values[0]))
+    labels = list(map(standardize_names, model_df.labels.values[0]))
 
     # fix image url
     image_url = pad_url + card_df.processed_file_location.values[0]
@@ -998,22 +1506,15 @@ def predict(card_id, model_id, actual_api=None, verbose=False):
     if model_type == "tf_lite":
         prediction = nn_predict(image_url, model_file, labels)
     else:
-        # Use temporary directory for better cross-platform compatibility
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as temp_file:
-            temp_filename = temp_file.name
-
-        try:
-            download_file(
-                image_url,
-                os.path.basename(temp_filename),
-                os.path.dirname(temp_filename),
-            )
-            pls_conc = pls(model_file)
-            prediction = pls_conc.quantity(temp_filename, actual_api)
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_filename):
-                os.unlink(temp_filename)
+        # Decode the card in memory; no disk I/O on the critical path
+        if use_cache:
+            image = pad_image_cache.get_bytes(image_url, verify=False)
+        else:
+            r = pad_session.get(image_url, verify=False)
+            r.raise_for_status()
+            image = r.content
+        pls_conc = pls(model_file)
+        prediction = pls_conc.quantity(image, actual_api)
 
     return actual_label, prediction
 
@@ -5,63 +5,132 @@ import numpy as np
 # Takes a list of pixels and a BGR image and returns the average
 # RGB pixel values
 def avgPixels(pixels, img):
-    totalB = 0.0  # Use float to prevent overflow
-    totalG = 0.0
-    totalR = 0.0
-    for pixel in pixels:
-        x = pixel[0]
-        y = pixel[1]
-        b, g, r = img[x, y, :]
-        # Convert to float to prevent overflow
-        totalB += float(b)
-        totalG += float(g)
-        totalR += float(r)
-    if len(pixels) != 0:
-        totalB /= len(pixels)
-        totalG /= len(pixels)
-        totalR /= len(pixels)
-    return int(totalR + 0.5), int(totalG + 0.5), int(totalB + 0.5)
+    return avgPixelsMask(pixelIndex(pixels), img)
 
 
 # Takes a list of pixels and a BGR image and returns the average
 # HSV pixel values
 def avgPixelsHSV(pixels, img):
-    workingImg = cv.cvtColor(img, cv.COLOR_BGR2HSV)
-    totalH = 0.0  # Use float to prevent overflow
-    totalS = 0.0
-    totalV = 0.0
-    for pixel in pixels:
-        x = pixel[0]
-        y = pixel[1]
-        h, s, v = workingImg[x, y, :]
-        # Convert to float to prevent overflow
-        totalH += float(h)
-        totalS += float(s)
-        totalV += float(v)
-    if len(pixels) != 0:
-        totalH /= len(pixels)
-        totalS /= len(pixels)
-        totalV /= len(pixels)
-    return totalH, totalS, totalV
+    return avgPixelsHSVMask(pixelIndex(pixels), img)
 
 
 # Takes a list of pixels and a BGR image and returns the average
 # Lab pixel values
 def avgPixelsLAB(pixels, img):
-    workingImg = cv.cvtColor(img, cv.COLOR_BGR2Lab)
-    totalL = 0.0  # Use float to prevent overflow
-    totalA = 0.0
-    totalB = 0.0
-    for pixel in pixels:
-        x = pixel[0]
-        y = pixel[1]
-        l, a, b = workingImg[x, y, :]
-        # Convert to float to prevent overflow
-        totalL += float(l)
-        totalA += float(a)
-        totalB += float(b)
-    if len(pixels) != 0:
-        totalL /= len(pixels)
-        totalA /= len(pixels)
-        totalB /= len(pixels)
-    return int(totalL + 0.5), int(totalA + 0.5), int(totalB + 0.5)
+    return avgPixelsLABMask(pixelIndex(pixels), img)
+
+
+# Takes any sequence of (row, col) pairs and returns (rows, cols) index
+# arrays. Used by the pixel-list wrappers, so a list of exactly two pixels
+# is never mistaken for a (rows, cols) pair.
+def pixelIndex(pixels):
+    idx = np.asarray(pixels, dtype=np.intp).reshape(-1, 2)
+    return idx[:, 0], idx[:, 1]
+
+
+# Takes a pixel selection and returns it in a form NumPy can index with.
+# A selection is a boolean mask shaped like the image, a (rows, cols) pair
+# of index arrays as returned by np.nonzero, or a list of (row, col) tuples.
+def toSelection(pixels):
+    if isinstance(pixels, np.ndarray) and pixels.dtype == bool:
+        return pixels
+    if (
+        isinstance(pixels, tuple)
+        and len(pixels) == 2
+        and all(isinstance(axis, np.ndarray) for axis in pixels)
+    ):
+        rows, cols = pixels
+        return rows.astype(np.intp, copy=False), cols.astype(np.intp, copy=False)
+    return pixelIndex(pixels)
+
+
+# Takes a selection and an image and returns the float64 per-channel means.
+# Sums are done in int64, so they are exact and match the scalar loops.
+def channelMeans(selection, img):
+    selected = img[toSelection(selection)]
+    count = selected.shape[0]
+    if count == 0:
+        return np.zeros(img.shape[2], dtype=np.float64)
+    return selected.sum(axis=0, dtype=np.int64) / count
+
+
+# Rounds a float mean the same way the scalar loops do
+def _roundMean(value):
+    return int(value + 0.5)
+
+
+# Takes a mask (or index arrays) and a BGR image and returns the average
+# RGB pixel values
+def avgPixelsMask(selection, img):
+    b, g, r = channelMeans(selection, img)
+    return _roundMean(r), _roundMean(g), _roundMean(b)
+
+
+# Takes a mask (or index arrays) and a BGR image and returns the average
+# HSV pixel values
+def avgPixelsHSVMask(selection, img):
+    h, s, v = channelMeans(selection, cv.cvtColor(img, cv.COLOR_BGR2HSV))
+    return float(h), float(s), float(v)
+
+
+# Takes a mask (or index arrays) and a BGR image and returns the average
+# Lab pixel values
+def avgPixelsLABMask(selection, img):
+    l, a, b = channelMeans(selection, cv.cvtColor(img, cv.COLOR_BGR2Lab))
+    return _roundMean(l), _roundMean(a), _roundMean(b)
+
+
+# Takes a mask (or index arrays) and a BGR image and returns the RGB, HSV
+# and Lab averages together from a single reduction over the selection
+def avgPixelsAll(selection, img):
+    planes = np.concatenate(
+        [
+            img,
+            cv.cvtColor(img, cv.COLOR_BGR2HSV),
+            cv.cvtColor(img, cv.COLOR_BGR2Lab),
+        ],
+        axis=2,
+    )
+    b, g, r, h, s, v, l, a, labB = channelMeans(selection, planes)
+    rgb = (_roundMean(r), _roundMean(g), _roundMean(b))
+    hsv = (float(h), float(s), float(v))
+    lab = (_roundMean(l), _roundMean(a), _roundMean(labB))
+    return rgb, hsv, lab
+
+
+# Per-card color planes. HSV and Lab are converted once for the whole card,
+# on first use, and every lane/region reduction reads a slice of them.
+# Both conversions are per-pixel, so slicing the converted card gives the
+# same values as converting each ROI separately.
+class ColorPlanes:
+    def __init__(self, img):
+        self.bgr = img
+        self._hsv = None
+        self._lab = None
+
+    @property
+    def hsv(self):
+        if self._hsv is None:
+            self._hsv = cv.cvtColor(self.bgr, cv.COLOR_BGR2HSV)
+        return self._hsv
+
+    @property
+    def lab(self):
+        if self._lab is None:
+            self._lab = cv.cvtColor(self.bgr, cv.COLOR_BGR2Lab)
+        return self._lab
+
+    # Average RGB of a selection inside the rows/cols slices of the card
+    def avgRGB(self, selection, rows, cols):
+        b, g, r = channelMeans(selection, self.bgr[rows, cols, :])
+        return _roundMean(r), _roundMean(g), _roundMean(b)
+
+    # Average HSV of a selection inside the rows/cols slices of the card
+    def avgHSV(self, selection, rows, cols):
+        h, s, v = channelMeans(selection, self.hsv[rows, cols, :])
+        return float(h), float(s), float(v)
+
+    # Average Lab of a selection inside the rows/cols slices of the card
+    def avgLAB(self, selection, rows, cols):
+        l, a, b = channelMeans(selection, self.lab[rows, cols, :])
+        return _roundMean(l), _roundMean(a), _roundMean(b)
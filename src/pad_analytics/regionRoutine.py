@@ -3,17 +3,20 @@ import numpy as np
 from . import fileManagement as fm
 from . import intensityFind as intFind
 from . import pixelProcessing as px
+from . import roiGeometry as geo
+from . import pad_image_cache as imageCache
+from . import pad_session
 import pandas as pd
 import os
 import csv
-import urllib.request
 import warnings
-import math
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-import tempfile
+from functools import lru_cache
 
-HORIZONTAL_BORDER = 12
-VERTICAL_BORDER = 0
+HORIZONTAL_BORDER = geo.HORIZONTAL_BORDER
+VERTICAL_BORDER = geo.VERTICAL_BORDER
 SAVE_DIR = "./Data/"
 REQS = {
     "ORIG_DIR": "Original_Images",
@@ -22,16 +25,13 @@ REQS = {
     "LOG": "log.txt",
     "MASTER": "PADData.csv",
 }
+LANES = ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L"]
+RGB_CHANNELS = ("R", "G", "B")
+LAB_CHANNELS = ("L", "a", "b")
 
 
 def regionGen(regions, region):
-    start = 359
-    totalLength = 273
-    regionStart = start + math.floor(totalLength * (region / regions)) + VERTICAL_BORDER
-    regionEnd = (
-        start + math.floor(totalLength * ((region + 1) / regions)) - VERTICAL_BORDER
-    )
-    return regionStart, regionEnd
+    return geo.regionGen(regions, region)
 
 
 """
@@ -51,11 +51,10 @@ def fullRoutine_old(img, roiFunc, RGB=True, regions=3, display=False):
         cv.imshow("in", imgC)
         cv.imshow("out", imgHSV[:, :, 1])
         cv.waitKey()
+    bounds = geo.roiBounds(regions, img.shape)
     for lane in range(1, 13):
-        laneStart = 17 + (53 * lane) + HORIZONTAL_BORDER
-        laneEnd = 17 + (53 * (lane + 1)) - HORIZONTAL_BORDER
         for region in range(regions):
-            regionStart, regionEnd = regionGen(regions, region)
+            regionStart, regionEnd, laneStart, laneEnd = bounds[lane - 1, region]
             roi = imgHSV[regionStart:regionEnd, laneStart:laneEnd, :]
             rgbROI = img[regionStart:regionEnd, laneStart:laneEnd, :]
             pixels = roiFunc(roi)
@@ -112,65 +111,399 @@ def fullRoutine_old(img, roiFunc, RGB=True, regions=3, display=False):
     return fImg, df
 
 
+# Returns the feature column names matching the layout of extractFeatures,
+# e.g. ("A1-R", "A1-G", "A1-B", "A2-R", ...). The tuple is shared between
+# calls, so it must not be modified.
+@lru_cache(maxsize=None)
+def featureColumns(regions=3, RGB=True):
+    channels = RGB_CHANNELS if RGB else LAB_CHANNELS
+    return tuple(
+        letter + str(region + 1) + "-" + channel
+        for letter in LANES
+        for region in range(regions)
+        for channel in channels
+    )
+
+
+# Takes a BGR card and returns its features as an int64 array of shape
+# (12 lanes, regions, 3). Channels are (R, G, B) or (L, a, b); flattening
+# the array gives the values in featureColumns(regions, RGB) order.
+def extractFeatures(img, roiFunc=intFind.findFilteredMask, RGB=True, regions=3):
+    features = np.empty((len(LANES), regions, 3), dtype=np.int64)
+    # Color spaces are converted once per card and sliced per ROI
+    planes = px.ColorPlanes(img)
+    imgHSV = planes.hsv
+    average = planes.avgRGB if RGB else planes.avgLAB
+    for lane, region, rows, cols in geo.roiSlices(regions, img.shape):
+        pixels = roiFunc(imgHSV[rows, cols, :])
+        features[lane, region] = average(pixels, rows, cols)
+    return features
+
+
+# Dict form of extractFeatures: fills df with one entry per feature column
 def fullRoutine(img, roiFunc, df, RGB=True, regions=3):
-    letters = ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L"]
-    rList = []
-    gList = []
-    bList = []
-    imgHSV = cv.cvtColor(img, cv.COLOR_BGR2HSV)
-    for lane in range(1, 13):
-        laneStart = 17 + (53 * lane) + HORIZONTAL_BORDER
-        laneEnd = 17 + (53 * (lane + 1)) - HORIZONTAL_BORDER
-        letter = letters[lane - 1]
-        for region in range(regions):
-            regionStart, regionEnd = regionGen(regions, region)
-            roi = imgHSV[regionStart:regionEnd, laneStart:laneEnd, :]
-            rgbROI = img[regionStart:regionEnd, laneStart:laneEnd, :]
-            pixels = roiFunc(roi)
-            tempString = letter + str(region + 1) + "-"
-            # Switches between RGB and Lab
-            if RGB:
-                r, g, b = px.avgPixels(pixels, rgbROI)
-                df[tempString + "R"] = r
-                df[tempString + "G"] = g
-                df[tempString + "B"] = b
-            else:
-                l, a, blu = px.avgPixelsLAB(pixels, rgbROI)
-                df[tempString + "L"] = l
-                df[tempString + "a"] = a
-                df[tempString + "b"] = blu
+    features = extractFeatures(img, roiFunc, RGB, regions)
+    df.update(zip(featureColumns(regions, RGB), features.ravel().tolist()))
     return df
 
 
-def directorySearch(target, RGB=True, regions=3, save_dir=SAVE_DIR):
+# Takes a BGR card and an iterable of (regions, RGB) settings and returns
+# {(regions, RGB): features} with the same arrays extractFeatures gives for
+# intFind.findFilteredMask. The card is filtered once per region count with
+# the per-ROI weight maps laid out side by side; the masked channels go into
+# one summed-area table, and every ROI of every setting is a rectangle query.
+# RGB and Lab settings with the same region count share the mask and table.
+def extractMultiFeatures(img, settings):
+    settings = [(int(regions), bool(RGB)) for regions, RGB in settings]
+    planes = px.ColorPlanes(img)
+    results = {}
+    for regions in sorted({regions for regions, _ in settings}):
+        spaces = [RGB for r, RGB in settings if r == regions]
+        bounds = geo.roiBounds(regions, img.shape)
+        rowStart, colStart = bounds[..., 0].min(), bounds[..., 2].min()
+        rowEnd, colEnd = bounds[..., 1].max(), bounds[..., 3].max()
+        window = (slice(rowStart, rowEnd), slice(colStart, colEnd))
+        thresholds = _layoutThresholds(regions, img.shape[:2])
+        mask = intFind.applyThresholdFilter(planes.hsv[window], thresholds)
+        channels = []
+        if True in spaces:
+            channels.append(planes.bgr[window][..., ::-1])
+        if False in spaces:
+            channels.append(planes.lab[window])
+        channels.append(np.ones(mask.shape + (1,), dtype=np.uint8))
+        masked = np.concatenate(channels, axis=2) * mask[..., None]
+        sums = _rectangleSums(
+            _summedAreaTable(masked), bounds - (rowStart, rowStart, colStart, colStart)
+        )
+        counts = sums[..., -1:]
+        means = np.divide(
+            sums[..., :-1], counts, out=np.zeros(sums[..., :-1].shape), where=counts > 0
+        )
+        features = np.floor(means + 0.5).astype(np.int64)
+        offset = 0
+        for RGB in (True, False):
+            if RGB in spaces:
+                results[(regions, RGB)] = features[..., offset : offset + 3]
+                offset += 3
+    return {setting: results[setting] for setting in settings}
+
+
+# Takes an (N, H, W, 3) uint8 stack of BGR cards, or a list of same-shape
+# cards, and returns an (N, 12 * regions * 3) int64 matrix whose rows are
+# extractFeatures(card, intFind.findFilteredMask, RGB, regions).ravel(), in
+# featureColumns(regions, RGB) order. Masking and reductions run over the
+# whole chunk at once; chunkSize bounds the temporary arrays.
+def extractFeaturesBatch(imgs, RGB=True, regions=3, chunkSize=64):
+    if isinstance(imgs, np.ndarray):
+        stack = imgs
+    else:
+        stack = np.stack(imgs) if len(imgs) else np.empty((0, 0, 0, 3), np.uint8)
+    if stack.ndim != 4 or stack.shape[3] != 3 or stack.dtype != np.uint8:
+        raise ValueError(
+            "Expected an (N, H, W, 3) uint8 stack of cards, found %s %s"
+            % (str(stack.shape), str(stack.dtype))
+        )
+    output = np.empty((stack.shape[0], len(LANES) * regions * 3), dtype=np.int64)
+    if stack.shape[0] == 0:
+        return output
+    bounds = geo.roiBounds(regions, stack.shape[1:])
+    rowStart, colStart = bounds[..., 0].min(), bounds[..., 2].min()
+    rowEnd, colEnd = bounds[..., 1].max(), bounds[..., 3].max()
+    thresholds = _layoutThresholds(regions, stack.shape[1:3])
+    # ROI edges inside the window, interleaved as start, end per region/lane.
+    # The final end is the window edge, where reduceat sums to anyway.
+    rowIndex = (bounds[0, :, :2] - rowStart).ravel()[:-1]
+    colIndex = (bounds[:, 0, 2:] - colStart).ravel()[:-1]
+    for start in range(0, stack.shape[0], chunkSize):
+        # Always a copy, since the masking below writes into it
+        chunk = stack[
+            start : start + chunkSize, rowStart:rowEnd, colStart:colEnd
+        ].copy()
+        n, height, width = chunk.shape[:3]
+        # Conversions are per-pixel, so the chunk converts as one tall image
+        flat = chunk.reshape(n * height, width, 3)
+        hsv = cv.cvtColor(flat, cv.COLOR_BGR2HSV).reshape(chunk.shape)
+        if RGB:
+            values = chunk
+        else:
+            values = cv.cvtColor(flat, cv.COLOR_BGR2Lab).reshape(chunk.shape)
+        mask = intFind.applyThresholdFilter(hsv, thresholds)
+        np.multiply(values, mask[..., None], out=values)
+        sums = _laneRegionSums(values, rowIndex, colIndex)
+        counts = _laneRegionSums(mask[..., None], rowIndex, colIndex)
+        if RGB:
+            sums = sums[..., ::-1]
+        means = np.divide(sums, counts, out=np.zeros(sums.shape), where=counts > 0)
+        output[start : start + n] = np.floor(means + 0.5).reshape(n, -1)
+    return output
+
+
+# Takes an (N, h, w, c) array and the interleaved row/column ROI edges of
+# extractFeaturesBatch and returns the int64 sums as (N, lanes, regions, c)
+def _laneRegionSums(values, rowIndex, colIndex):
+    # A region spans at most one card height, so int32 cannot overflow here
+    sums = np.add.reduceat(values, rowIndex, axis=1, dtype=np.int32)[:, ::2]
+    sums = np.add.reduceat(sums, colIndex, axis=2, dtype=np.int64)[:, :, ::2]
+    return sums.transpose(0, 2, 1, 3)
+
+
+# Cosine weights for every ROI of a region count, placed at their position
+# inside the bounding window of the layout. Cached per region count and
+# card shape, and read-only because it is shared.
+@lru_cache(maxsize=None)
+def _layoutWeights(regions, shape):
+    bounds = geo.roiBounds(regions, shape)
+    rowStart, colStart = bounds[..., 0].min(), bounds[..., 2].min()
+    weights = np.zeros(
+        (bounds[..., 1].max() - rowStart, bounds[..., 3].max() - colStart),
+        dtype=np.float64,
+    )
+    for _, _, rows, cols in geo.roiSlices(regions, shape):
+        height, width = rows.stop - rows.start, cols.stop - cols.start
+        weights[
+            rows.start - rowStart : rows.stop - rowStart,
+            cols.start - colStart : cols.stop - colStart,
+        ] = intFind.cosWeightMap(height, width)
+    weights.setflags(write=False)
+    return weights
+
+
+# Integer filter thresholds for _layoutWeights, see intFind.weightThresholds
+@lru_cache(maxsize=None)
+def _layoutThresholds(regions, shape):
+    return intFind.weightThresholds(_layoutWeights(regions, shape))
+
+
+# Takes an (h, w, c) uint8 array and returns its (h + 1, w + 1, c)
+# summed-area table, with a zero first row and column. int32 holds the sum
+# of a full card (1250 * 730 * 255) without overflow.
+def _summedAreaTable(values):
+    return cv.integral(np.ascontiguousarray(values), sdepth=cv.CV_32S)
+
+
+# Takes a summed-area table and an (..., 4) array of
+# (rowStart, rowEnd, colStart, colEnd) bounds and returns the channel sums
+# of every rectangle
+def _rectangleSums(table, bounds):
+    r0, r1, c0, c1 = bounds[..., 0], bounds[..., 1], bounds[..., 2], bounds[..., 3]
+    corners = np.stack([table[r1, c1], table[r0, c1], table[r1, c0], table[r0, c0]])
+    corners = corners.astype(np.int64)
+    return corners[0] - corners[1] - corners[2] + corners[3]
+
+
+# Error line for a card that is not one of the expected shapes
+def _cardShapeError(name, shape):
+    return str.format(
+        "Error with file %s. Expected shape %s, found shape %s.\n"
+        % (name, "(1250, 730, 3) or (1220, 730, 3)", str(shape))
+    )
+
+
+# Error line for a card whose PNG/JPEG header already shows the wrong
+# shape, or None. Rejects bad files before they are decoded; cards that
+# pass (or are in other formats) are still checked after decoding.
+def _headerError(name, source):
+    shape = fm.imageShape(source)
+    if shape is not None and shape not in geo.CARD_SHAPES:
+        return _cardShapeError(name, shape)
+    return None
+
+
+# Header check of one file for validateCards, falling back to a full
+# decode for formats imageShape does not read. Returns (path, error).
+def _validateFile(path):
+    try:
+        shape = fm.imageShape(path)
+        if shape is None:
+            img = cv.imread(path)
+            if img is None:
+                raise ValueError("could not decode image")
+            shape = img.shape
+        if shape not in geo.CARD_SHAPES:
+            return path, _cardShapeError(path, shape)
+        return path, None
+    except Exception as e:
+        return path, str.format("Error %s with file %s.\n" % (str(e), path))
+
+
+# Checks the shape of every card in target, a directory or a list of
+# paths, from the image headers alone, reading them in workers threads.
+# Returns {path: error line} for the files that would be rejected.
+def validateCards(target, workers=8):
+    if isinstance(target, str):
+        paths = [os.path.join(target, file) for file in sorted(os.listdir(target))]
+    else:
+        paths = list(target)
+    jobs = ((path,) for path in paths)
+    return {
+        path: error
+        for path, error in _orderedMap(_validateFile, jobs, workers, threads=True)
+        if error is not None
+    }
+
+
+# Per-image layout of fullRoutine_old: one row per lane/region, one column
+# per channel. This is what fileManagement.convertToDF reads back.
+def _regionFrame(features, RGB=True):
+    regions = features.shape[1]
+    index = [
+        letter + " - Region " + str(region + 1)
+        for letter in LANES
+        for region in range(regions)
+    ]
+    columns = list(RGB_CHANNELS if RGB else LAB_CHANNELS)
+    return pd.DataFrame(features.reshape(-1, 3), columns=columns, index=index)
+
+
+# Decodes, validates and extracts one card. Runs in the worker processes
+# of directorySearch, so it returns (name, features, error) instead of
+# touching the log.
+def _searchFile(path, name, RGB, regions):
+    try:
+        error = _headerError(name, path)
+        if error is not None:
+            return name, None, error
+        img = cv.imread(path)
+        if img.shape not in geo.CARD_SHAPES:
+            return name, None, _cardShapeError(name, img.shape)
+        features = extractFeatures(img, intFind.findFilteredMask, RGB, regions)
+        return name, features, None
+    except Exception as e:
+        return name, None, str.format("Error %s with file %s.\n" % (str(e), name))
+
+
+# Keeps OpenCV from spawning its own threads inside each worker process
+def _initWorker():
+    cv.setNumThreads(1)
+
+
+# Calls func(*args) for every args in argsList and yields the results in
+# order. With workers > 1 (or threads=True) the calls run in a process (or
+# thread) pool, with at most maxInFlight (default 2 * workers) submitted but
+# not yet consumed. This is the bounded queue between pipeline stages: the
+# number of cards held in memory stays fixed however long argsList is.
+def _orderedMap(func, argsList, workers=1, maxInFlight=None, threads=False):
+    if workers <= 1 and not threads:
+        for args in argsList:
+            yield func(*args)
+        return
+    if maxInFlight is None:
+        maxInFlight = 2 * workers
+    maxInFlight = max(maxInFlight, 1)
+    if threads:
+        pool = ThreadPoolExecutor(max_workers=max(workers, 1))
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_initWorker)
+    with pool:
+        pending = deque()
+        for args in argsList:
+            pending.append(pool.submit(func, *args))
+            if len(pending) >= maxInFlight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# Takes a manifest path or fm.RunManifest (or None) and returns
+# (manifest, whether the caller must close it)
+def _openManifest(manifest):
+    if manifest is None or isinstance(manifest, fm.RunManifest):
+        return manifest, False
+    return fm.RunManifest(manifest), True
+
+
+# Extracts every card in target and writes one CSV per card under
+# save_dir. With workers > 1 the cards are decoded and processed in a
+# process pool; results come back in directory order and are written by
+# this process only. With a manifest (path or fm.RunManifest) finished
+# cards are checkpointed and skipped when the run is repeated. With a table
+# name the rows go to a single fm.FeatureTableWriter table under save_dir
+# instead, flushed (and committed) every flushRows cards. Returns the
+# feature rows of the cards processed in this run as a DataFrame indexed
+# by file name.
+def directorySearch(
+    target,
+    RGB=True,
+    regions=3,
+    save_dir=SAVE_DIR,
+    workers=1,
+    maxInFlight=None,
+    manifest=None,
+    table=None,
+    formats=("csv",),
+    flushRows=500,
+):
     startTime = datetime.now()
     fm.checkFormating(save_dir)
     errors = open(save_dir + REQS["LOG"], "a")
+    manifest, ownManifest = _openManifest(manifest)
+    setting = "%d_region_%s" % (regions, "rgb" if RGB else "lab")
     files = os.listdir(target)
-    panic = 0
-    for file in files:
-        print(file)
-        try:
-            img = cv.imread(target + file)
-            if (1250, 730, 3) != img.shape and (1220, 730, 3) != img.shape:
-                errorString = str.format(
-                    "Error with file %s. Expected shape %s, found shape %s.\n"
-                    % (file, "(1250, 730, 3) or (1220, 730, 3)", str(img.shape))
-                )
+    if manifest is not None:
+        files = [file for file in files if not manifest.isDone(file, [setting])]
+    writer = None
+    if table is not None:
+        outputs = fm.FeatureTableWriter.outputsFor(save_dir + table, formats)
+        if manifest is not None:
+            manifest.rollback(outputs)
+        writer = fm.FeatureTableWriter(
+            save_dir + table,
+            featureColumns(regions, RGB),
+            metaColumns=("Image",),
+            formats=formats,
+            flushRows=None,
+        )
+    buffered = []
+
+    def flush():
+        if writer is not None:
+            writer.flush()
+            if manifest is not None and buffered:
+                manifest.commitBatch(buffered, outputs)
+        buffered.clear()
+
+    names = []
+    rows = []
+    jobs = ((target + file, file, RGB, regions) for file in files)
+    try:
+        for file, features, errorString in _orderedMap(
+            _searchFile, jobs, workers, maxInFlight
+        ):
+            print(file)
+            if errorString is None:
+                try:
+                    if writer is None:
+                        df = _regionFrame(features, RGB)
+                        fm.outputFile(file, None, df, None, False, False, save_dir)
+                        if manifest is not None:
+                            manifest.commit(file, [setting])
+                    else:
+                        writer.append([file], features)
+                        buffered.append((file, [setting]))
+                        if len(buffered) >= flushRows:
+                            flush()
+                    names.append(file)
+                    rows.append(features.ravel())
+                except Exception as e:
+                    errorString = str.format(
+                        "Error %s with file %s.\n" % (str(e), file)
+                    )
+            if errorString is not None:
                 errors.write(errorString)
                 warnings.warn(errorString)
-            else:
-                res, df = fullRoutine(
-                    img, intFind.findMaxIntensitiesFiltered, RGB, regions
-                )
-                fm.outputFile(file, img, df, res, False, False, save_dir)
-        except Exception as e:
-            errorString = str.format("Error %s with file %s.\n" % (str(e), file))
-            errors.write(errorString)
-            warnings.warn(errorString)
-    errors.close()
+    finally:
+        flush()
+        errors.close()
+        if ownManifest:
+            manifest.close()
     endTime = datetime.now()
     print("Time: ", endTime - startTime)
+    columns = featureColumns(regions, RGB)
+    return pd.DataFrame(
+        np.array(rows, dtype=np.int64).reshape(len(rows), len(columns)),
+        index=names,
+        columns=columns,
+    )
 
 
 def tempTest(target, regions):
@@ -180,7 +513,7 @@ def tempTest(target, regions):
         print(file)
         img = cv.imread(target + file)
         data = {}
-        data = fullRoutine(img, intFind.findMaxIntensitiesFiltered, data, True, regions)
+        data = fullRoutine(img, intFind.findFilteredMask, data, True, regions)
         data["Image"] = file
         df = pd.DataFrame(data, columns=index, index=[data["Image"]])
         print(df)
@@ -196,63 +529,162 @@ def addIndex(runSettings):
     return runSettings
 
 
-def csvReader(target, runSettings, save_dir=SAVE_DIR):
+# Fetches url for the image cache on a miss, on the pooled pad_session so
+# connections are reused and a stalled one times out and is retried
+def _sessionRead(url):
+    response = pad_session.get(url)
+    response.raise_for_status()
+    return response.content
+
+
+# Downloads one card into memory, through the shared pad_image_cache so
+# cards fetched before are read from disk, and checks its header shape, so
+# bad uploads never reach the extraction workers. Runs in the downloader
+# threads of csvReader and returns (row, data, error).
+def _downloadRow(url, row):
+    try:
+        data = imageCache.get_bytes(url + row[7], fetch=_sessionRead)
+        error = _headerError(row[0], data)
+        if error is not None:
+            return row, None, error
+        return row, data, None
+    except Exception as e:
+        return row, None, str.format("Error %s with file %s.\n" % (str(e), row[0]))
+
+
+# Decodes one downloaded card from memory, validates it and extracts every
+# (regions, RGB) setting. Runs in the extraction workers of csvReader and
+# returns (row, features, error).
+def _extractRow(row, data, error, settings):
+    if error is not None:
+        return row, None, error
+    try:
+        img = cv.imdecode(np.frombuffer(data, dtype=np.uint8), cv.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("could not decode image")
+        if img.shape not in geo.CARD_SHAPES:
+            return row, None, _cardShapeError(row[0], img.shape)
+        return row, extractMultiFeatures(img, settings), None
+    except Exception as e:
+        return row, None, str.format("Error %s with file %s.\n" % (str(e), row[0]))
+
+
+# Downloads and extracts every card listed in the target CSV and appends
+# one row per card to each runSettings output. Downloads run in
+# downloadWorkers threads on the shared pad_session (keep it within the
+# session pool size) and feed decoded-in-memory extraction, in workers
+# processes when workers > 1, through a queue of at most queueSize cards
+# (default 2 * the larger pool), so network and CPU work overlap. Rows are
+# written in input order by this process only, through one buffered
+# fm.FeatureTableWriter per setting that flushes every flushRows cards in
+# the given formats ("csv" and/or "npy"). With a manifest (path or
+# fm.RunManifest) each flushed chunk of cards is committed; a rerun rolls
+# the outputs back to the last commit and skips finished cards, so every
+# row is written exactly once.
+def csvReader(
+    target,
+    runSettings,
+    save_dir=SAVE_DIR,
+    downloadWorkers=4,
+    workers=1,
+    queueSize=None,
+    manifest=None,
+    formats=("csv",),
+    flushRows=500,
+):
     startTime = datetime.now()
     url = "https://pad.crc.nd.edu"
-    # Use temporary file instead of hardcoded path
-    temp_file = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-    dest = temp_file.name
-    temp_file.close()
     fm.checkFormating(save_dir)
     errors = open(save_dir + REQS["LOG"], "a")
+    settings = {
+        setting: (runSettings[setting]["regions"], runSettings[setting]["RGB"])
+        for setting in runSettings
+    }
+    settingList = list(settings.values())
+    if queueSize is None:
+        queueSize = 2 * max(downloadWorkers, workers, 1)
+    manifest, ownManifest = _openManifest(manifest)
+    outputs = [
+        output
+        for setting in runSettings
+        for output in fm.FeatureTableWriter.outputsFor(save_dir + setting, formats)
+    ]
+    if manifest is not None:
+        manifest.rollback(outputs)
+    writers = {
+        setting: fm.FeatureTableWriter(
+            save_dir + setting,
+            featureColumns(*settings[setting]),
+            formats=formats,
+            flushRows=None,
+        )
+        for setting in runSettings
+    }
+    # Cards buffered in the writers but not yet flushed and committed
+    buffered = []
+
+    def flush():
+        for writer in writers.values():
+            writer.flush()
+        if manifest is not None and buffered:
+            manifest.commitBatch(buffered, outputs)
+        buffered.clear()
+
     print("Starting...")
     with open(target) as csvfile:
         csvreader = csv.reader(csvfile)
+        if manifest is not None:
+            csvreader = (
+                row for row in csvreader if not manifest.isDone(row[0], runSettings)
+            )
+        downloads = _orderedMap(
+            _downloadRow,
+            ((url, row) for row in csvreader),
+            downloadWorkers,
+            queueSize,
+            threads=True,
+        )
+        extractions = _orderedMap(
+            _extractRow,
+            ((row, data, error, settingList) for row, data, error in downloads),
+            workers,
+            queueSize,
+        )
         i = 0
-        for row in csvreader:
-            cTime = datetime.now()
-            i += 1
-            try:
-                urllib.request.urlretrieve(url + row[7], dest)
-                img = cv.imread(dest)
-                if (1250, 730, 3) != img.shape and (1220, 730, 3) != img.shape:
+        cTime = datetime.now()
+        try:
+            for row, features, errorString in extractions:
+                i += 1
+                try:
+                    if errorString is not None:
+                        errors.write(errorString)
+                        warnings.warn(errorString)
+                        continue
+                    pending = list(runSettings)
+                    if manifest is not None:
+                        pending = manifest.pending(row[0], pending)
+                    meta = [row[0], row[1], row[18], row[17]]
+                    for setting in pending:
+                        writers[setting].append(meta, features[settings[setting]])
+                    buffered.append((row[0], pending))
+                    if len(buffered) >= flushRows:
+                        flush()
+                    elapsedTime = datetime.now() - cTime
+                    print("Finished image ", row[0], " in ", elapsedTime)
+                except Exception as e:
                     errorString = str.format(
-                        "Error with file %s. Expected shape %s, found shape %s.\n"
-                        % (file, "(1250, 730, 3) or (1220, 730, 3)", str(img.shape))
+                        "Error %s with file %s.\n" % (str(e), row[0])
                     )
                     errors.write(errorString)
                     warnings.warn(errorString)
-                else:
-                    for setting in runSettings:
-                        data = {}
-                        data = fullRoutine(
-                            img,
-                            intFind.findMaxIntensitiesFiltered,
-                            data,
-                            runSettings[setting]["RGB"],
-                            runSettings[setting]["regions"],
-                        )
-                        data["Image"] = row[0]
-                        data["Contains"] = row[1]
-                        data["Drug %"] = row[18]
-                        data["PAD S#"] = row[17]
-                        df = pd.DataFrame(
-                            data,
-                            columns=runSettings[setting]["Index"],
-                            index=[data["Image"]],
-                        )
-                        if not os.path.exists(save_dir + setting):
-                            df.to_csv(save_dir + setting, mode="w", header=True)
-                        else:
-                            df.to_csv(save_dir + setting, mode="a", header=False)
-                    elapsedTime = datetime.now() - cTime
-                    print("Finished image ", row[0], " in ", elapsedTime)
-            except Exception as e:
-                errorString = str.format("Error %s with file %s.\n" % (str(e), row[0]))
-                errors.write(errorString)
-                warnings.warn(errorString)
-            os.remove(dest)
-        errors.close()
+                finally:
+                    cTime = datetime.now()
+        finally:
+            # Rows buffered before an interruption are still written once
+            flush()
+            errors.close()
+            if ownManifest:
+                manifest.close()
         endTime = datetime.now()
         regions = 3 + 12 + 20
         print("Time: ", endTime - startTime, " time saved = ", i * regions * 13 / 60.0)
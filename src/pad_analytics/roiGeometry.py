@@ -0,0 +1,83 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+
+# Card layout. Lanes are 53px wide starting at x = 17 + 53 (lane 1), and the
+# active area spans 273px starting at y = 359, split evenly into regions.
+LANE_COUNT = 12
+LANE_ORIGIN = 17
+LANE_WIDTH = 53
+REGION_START = 359
+REGION_LENGTH = 273
+HORIZONTAL_BORDER = 12
+VERTICAL_BORDER = 0
+CARD_SHAPES = ((1250, 730, 3), (1220, 730, 3))
+
+
+# Returns the (start, end) rows of a region, for a card split in regions
+def regionGen(regions, region):
+    regionStart = (
+        REGION_START + math.floor(REGION_LENGTH * (region / regions)) + VERTICAL_BORDER
+    )
+    regionEnd = (
+        REGION_START
+        + math.floor(REGION_LENGTH * ((region + 1) / regions))
+        - VERTICAL_BORDER
+    )
+    return regionStart, regionEnd
+
+
+# Returns the (start, end) columns of a lane, numbered 1 to 12
+def laneGen(lane):
+    laneStart = LANE_ORIGIN + (LANE_WIDTH * lane) + HORIZONTAL_BORDER
+    laneEnd = LANE_ORIGIN + (LANE_WIDTH * (lane + 1)) - HORIZONTAL_BORDER
+    return laneStart, laneEnd
+
+
+# Returns a read-only int array of shape (12 lanes, regions, 4) holding
+# (rowStart, rowEnd, colStart, colEnd) for every ROI. Tables are built once
+# per (regions, shape) and shared; when a card shape is given the ROIs are
+# checked to lie inside it.
+def roiBounds(regions=3, shape=None):
+    if shape is not None:
+        shape = tuple(int(v) for v in shape[:2])
+    return _roiBounds(int(regions), shape)
+
+
+# Returns the same table as roiBounds as a tuple of
+# (lane, region, rows, cols) entries, with lane and region counted from 0
+# and rows/cols as slices ready to index a card.
+def roiSlices(regions=3, shape=None):
+    if shape is not None:
+        shape = tuple(int(v) for v in shape[:2])
+    return _roiSlices(int(regions), shape)
+
+
+@lru_cache(maxsize=None)
+def _roiBounds(regions, shape):
+    if regions < 1:
+        raise ValueError("regions must be a positive integer, found %d" % regions)
+    bounds = np.empty((LANE_COUNT, regions, 4), dtype=np.intp)
+    for lane in range(LANE_COUNT):
+        laneStart, laneEnd = laneGen(lane + 1)
+        for region in range(regions):
+            regionStart, regionEnd = regionGen(regions, region)
+            bounds[lane, region] = (regionStart, regionEnd, laneStart, laneEnd)
+    if shape is not None:
+        height, width = shape
+        if bounds[..., 1].max() > height or bounds[..., 3].max() > width:
+            raise ValueError("ROI layout does not fit a card of shape %s" % str(shape))
+    bounds.setflags(write=False)
+    return bounds
+
+
+@lru_cache(maxsize=None)
+def _roiSlices(regions, shape):
+    bounds = _roiBounds(regions, shape)
+    return tuple(
+        (lane, region, slice(rowStart, rowEnd), slice(colStart, colEnd))
+        for lane in range(LANE_COUNT)
+        for region in range(regions)
+        for rowStart, rowEnd, colStart, colEnd in [bounds[lane, region].tolist()]
+    )
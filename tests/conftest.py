@@ -15,6 +15,13 @@ def setup_path():
         sys.path.insert(0, src_path)
 
 
+@pytest.fixture(autouse=True)
+def isolated_metadata_cache(tmp_path, monkeypatch):
+    """Keep the PAD metadata cache of each test in its own directory."""
+    monkeypatch.setenv("PAD_CACHE_DIR", str(tmp_path / "pad_cache"))
+    monkeypatch.delenv("PAD_OFFLINE", raising=False)
+
+
 @pytest.fixture
 def clean_environment():
     """Fixture that ensures clean environment variables for testing."""
@@ -32,8 +39,8 @@ def clean_environment():
 
 @pytest.fixture
 def mock_requests():
-    """Fixture that mocks requests.get for API calls."""
-    with patch("requests.get") as mock_get:
+    """Fixture that mocks pad_session.get for API calls."""
+    with patch("pad_analytics.pad_session.get") as mock_get:
         mock_response = MagicMock()
         mock_response.raise_for_status.return_value = None
         mock_get.return_value = mock_response
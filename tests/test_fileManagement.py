@@ -0,0 +1,270 @@
+"""Tests for fileManagement run bookkeeping and output helpers."""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Add src to path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+cv = pytest.importorskip("cv2")
+
+from pad_analytics import fileManagement
+
+
+class TestRunManifest:
+    """Checkpoint manifest for resumable extraction runs."""
+
+    def test_commits_survive_reload(self, tmp_path):
+        path = str(tmp_path / "run.manifest")
+        with fileManagement.RunManifest(path) as manifest:
+            manifest.commit("101", ["a.csv", "b.csv"])
+            manifest.commit(102, ["a.csv"])
+        with fileManagement.RunManifest(path) as manifest:
+            assert manifest.isDone("101", ["a.csv", "b.csv"])
+            assert manifest.pending("102", ["a.csv", "b.csv"]) == ["b.csv"]
+            assert manifest.pending("103", ["a.csv"]) == ["a.csv"]
+
+    def test_torn_last_line_is_ignored(self, tmp_path):
+        path = tmp_path / "run.manifest"
+        with fileManagement.RunManifest(str(path)) as manifest:
+            manifest.commit("101", ["a.csv"])
+        with open(path, "a") as handle:
+            handle.write('{"id": "102", "settings": ["a.c')
+        with fileManagement.RunManifest(str(path)) as manifest:
+            assert manifest.isDone("101", ["a.csv"])
+            assert not manifest.isDone("102", ["a.csv"])
+            manifest.commit("103", ["a.csv"])
+        with fileManagement.RunManifest(str(path)) as manifest:
+            assert manifest.isDone("103", ["a.csv"])
+
+    def test_rollback_drops_uncommitted_rows(self, tmp_path):
+        output = tmp_path / "out.csv"
+        with fileManagement.RunManifest(str(tmp_path / "run.manifest")) as manifest:
+            manifest.rollback([str(output)])
+            output.write_text("header\nrow1\n")
+            manifest.commit("1", ["out.csv"], [str(output)])
+            with open(output, "a") as handle:
+                handle.write("row2 half")
+            manifest.rollback([str(output)])
+        assert output.read_text() == "header\nrow1\n"
+
+    def test_rollback_removes_file_with_nothing_committed(self, tmp_path):
+        output = tmp_path / "out.csv"
+        path = str(tmp_path / "run.manifest")
+        with fileManagement.RunManifest(path) as manifest:
+            manifest.rollback([str(output)])
+        output.write_text("header\nrow1\n")
+        with fileManagement.RunManifest(path) as manifest:
+            manifest.rollback([str(output)])
+        assert not output.exists()
+
+
+class TestFeatureTableWriter:
+    """Buffered feature tables in CSV and appendable .npy form."""
+
+    columns = ["A1", "A2", "B1"]
+
+    def write(self, path, rows, **kwargs):
+        with fileManagement.FeatureTableWriter(
+            path, self.columns, metaColumns=("Image", "Drug %"), **kwargs
+        ) as writer:
+            for name, values in rows:
+                writer.append([name, "50"], values)
+
+    def test_csv_matches_row_appends(self, tmp_path):
+        import pandas as pd
+
+        path = str(tmp_path / "table.csv")
+        rows = [("1.png", [1, 2, 3]), ("2.png", [4, 5, 6]), ("3.png", [7, 8, 9])]
+        self.write(path, rows[:2], flushRows=1)
+        self.write(path, rows[2:])
+        expected = str(tmp_path / "expected.csv")
+        for name, values in rows:
+            data = dict(zip(self.columns, values), Image=name, **{"Drug %": "50"})
+            df = pd.DataFrame(
+                data, columns=["Image", "Drug %"] + self.columns, index=[name]
+            )
+            df.to_csv(expected, mode="a", header=not os.path.isfile(expected))
+        with open(path) as found, open(expected) as wanted:
+            assert found.read() == wanted.read()
+
+    def test_npy_reopens_and_appends(self, tmp_path):
+        path = str(tmp_path / "table.csv")
+        rows = [("1.png", [1, 2, 3]), ("2.png", [4, 5, 6])]
+        self.write(path, rows[:1], formats=("npy",))
+        self.write(path, rows[1:], formats=("npy",))
+        df = fileManagement.readFeatureTable(str(tmp_path / "table.npy"))
+        assert list(df.columns) == ["Image", "Drug %"] + self.columns
+        assert list(df["Image"]) == ["1.png", "2.png"]
+        assert df[self.columns].values.tolist() == [[1, 2, 3], [4, 5, 6]]
+
+    def test_npy_rejects_other_columns(self, tmp_path):
+        path = str(tmp_path / "table.csv")
+        self.write(path, [("1.png", [1, 2, 3])], formats=("npy",))
+        with pytest.raises(ValueError):
+            fileManagement.FeatureTableWriter(path, ["A1"], formats=("npy",))
+
+    def test_rollback_truncates_npy_table(self, tmp_path):
+        path = str(tmp_path / "table.csv")
+        outputs = fileManagement.FeatureTableWriter.outputsFor(path, ("npy",))
+        with fileManagement.RunManifest(str(tmp_path / "run.manifest")) as manifest:
+            manifest.rollback(outputs)
+            self.write(path, [("1.png", [1, 2, 3])], formats=("npy",))
+            manifest.commitBatch([("1.png", ["t"])], outputs)
+            self.write(path, [("2.png", [4, 5, 6])], formats=("npy",))
+            manifest.rollback(outputs)
+        df = fileManagement.readFeatureTable(str(tmp_path / "table.npy"))
+        assert list(df["Image"]) == ["1.png"]
+
+    @pytest.mark.parametrize("orphan", ["npy", "index"])
+    def test_npy_realigns_after_interrupted_flush(self, tmp_path, orphan):
+        import numpy as np
+
+        path = str(tmp_path / "table.csv")
+        self.write(path, [("1.png", [1, 2, 3])], formats=("npy",))
+        # A crash between the two writes of a flush leaves one row behind
+        if orphan == "npy":
+            fileManagement._appendNpyRows(
+                str(tmp_path / "table.npy"), np.array([[4, 5, 6]]), 1
+            )
+        else:
+            with open(tmp_path / "table.index.csv", "a") as index:
+                index.write("2.png,50\n")
+        self.write(path, [("3.png", [7, 8, 9])], formats=("npy",))
+        df = fileManagement.readFeatureTable(str(tmp_path / "table.npy"))
+        assert list(df["Image"]) == ["1.png", "3.png"]
+        assert df[self.columns].values.tolist() == [[1, 2, 3], [7, 8, 9]]
+
+
+class TestImageShape:
+    """Header shapes must match what cv.imread decodes."""
+
+    @pytest.mark.parametrize("ext", [".png", ".jpg"])
+    def test_matches_decoded_shape(self, ext, tmp_path):
+        img = np.zeros((37, 21, 3), dtype=np.uint8)
+        path = str(tmp_path / ("card" + ext))
+        cv.imwrite(path, img)
+        assert fileManagement.imageShape(path) == cv.imread(path).shape
+        with open(path, "rb") as handle:
+            assert fileManagement.imageShape(handle.read()) == (37, 21, 3)
+
+    def test_jpeg_exif_orientation(self):
+        import struct
+
+        ok, encoded = cv.imencode(".jpg", np.zeros((37, 21, 3), dtype=np.uint8))
+        tiff = b"MM" + struct.pack(">HIHHHIHHI", 42, 8, 1, 0x0112, 3, 1, 6, 0, 0)
+        payload = b"Exif\x00\x00" + tiff
+        app1 = b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+        data = encoded.tobytes()
+        data = data[:2] + app1 + data[2:]
+        decoded = cv.imdecode(np.frombuffer(data, dtype=np.uint8), cv.IMREAD_COLOR)
+        assert fileManagement.imageShape(data) == decoded.shape == (21, 37, 3)
+
+    def test_malformed_and_unknown(self):
+        ok, encoded = cv.imencode(".jpg", np.zeros((37, 21, 3), dtype=np.uint8))
+        with pytest.raises(ValueError):
+            fileManagement.imageShape(encoded.tobytes()[:20])
+        assert fileManagement.imageShape(b"BM not a png or jpeg") is None
+
+
+class TestCompressCSVs:
+    """Merging per-image CSVs into the master CSV."""
+
+    def write_card(self, target, name, seed):
+        import pandas as pd
+
+        values = np.random.default_rng(seed).integers(0, 256, (36, 3))
+        index = [
+            lane + " - Region " + str(region + 1)
+            for lane in "ABCDEFGHIJKL"
+            for region in range(3)
+        ]
+        pd.DataFrame(values, columns=["R", "G", "B"], index=index).to_csv(
+            str(target / (name + ".csv"))
+        )
+
+    def test_merge_matches_convertToDF_and_skips_known_cards(self, tmp_path):
+        import pandas as pd
+
+        target = tmp_path / "csv"
+        target.mkdir()
+        master = str(tmp_path / "master.csv")
+        self.write_card(target, "101", 1)
+        self.write_card(target, "abc", 2)
+        fileManagement.compressCSVs(master, str(target), 3, workers=2)
+        self.write_card(target, "7", 3)
+        fileManagement.compressCSVs(master, str(target), 3, workers=2)
+        result = pd.read_csv(master, index_col=0)
+        assert sorted(result.index.astype(str)) == ["101", "7", "abc"]
+        index = fileManagement.genIndex(3)
+        expected = fileManagement.convertToDF(str(target / "7.csv"), "7", index)
+        row = result.loc["7"]
+        assert [row[column] for column in index[4:]] == [expected[c] for c in index[4:]]
+
+
+class TestReadLanes:
+    """Lane color counts over the master CSV."""
+
+    def test_counts_and_filters(self, tmp_path):
+        import pandas as pd
+
+        columns = [
+            letter + str(j) + "-" + color
+            for letter in "ABCDEFGHIJKL"
+            for j in range(1, 4)
+            for color in "Lab"
+        ]
+        values = np.random.default_rng(5).integers(0, 4, (20, len(columns)))
+        df = pd.DataFrame(values, columns=columns, index=["c%d" % i for i in range(20)])
+        df.insert(0, "Drug %", [0, 50] * 10)
+        master = str(tmp_path / "master.csv")
+        df.to_csv(master)
+
+        laneHash, names = fileManagement.readLanes(
+            master, 3, req="Drug %", targetPercent=50, reqName=["c1", "c2", "c3"]
+        )
+        assert names == ["c%d" % i for i in range(1, 20, 2)]
+        expected = {}
+        for item in ["c1", "c3"]:
+            for j in range(1, 4):
+                color = tuple(int(df.loc[item]["B%d-%s" % (j, c)]) for c in "Lab")
+                expected[color] = expected.get(color, 0) + 1
+        assert laneHash["B"] == expected
+        assert sum(laneHash["All"].values()) == 2 * 12 * 3
+
+        quantized, _ = fileManagement.readLanes(master, 3, quantize=2)
+        assert set(value for color in quantized["All"] for value in color) <= {0, 2}
+
+
+class TestColorPoints:
+    """Scatter arrays for the lane color plots."""
+
+    def test_points_sizes_and_budget(self):
+        colors = {(0, 0, 0): 1, (1, 0, 0): 2, (255, 255, 255): 5, (8, 8, 8): 3}
+        points, sizes = fileManagement.colorPoints(colors)
+        assert points.shape == (4, 3) and points.max() == 1.0
+        assert sizes.tolist() == [1, 2, 5, 3]
+
+        points, sizes = fileManagement.colorPoints(colors, quantize=4)
+        assert (points * 255).round().tolist() == [
+            [0, 0, 0], [8, 8, 8], [252, 252, 252]
+        ]
+        assert sizes.tolist() == [3, 3, 5]
+
+        points, sizes = fileManagement.colorPoints(colors, maxPoints=2)
+        assert sizes.tolist() == [5, 3]
+
+    def test_graph_lanes_single_scatter(self, monkeypatch):
+        import matplotlib.pyplot as plt
+
+        monkeypatch.setattr(plt, "savefig", lambda *args, **kwargs: None)
+        monkeypatch.setattr(plt, "show", lambda: None)
+        laneHash = {"A": {(i, i, i): i + 1 for i in range(50)}}
+        fileManagement.graphLanes(laneHash, "A", maxPoints=10)
+        ax = plt.gcf().axes[0]
+        assert len(ax.collections) == 1
+        assert len(ax.collections[0].get_sizes()) == 10
+        plt.close("all")
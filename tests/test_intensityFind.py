@@ -0,0 +1,109 @@
+"""Regression tests for the vectorized ROI selection in intensityFind."""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Add src to path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+cv = pytest.importorskip("cv2")
+
+from pad_analytics import intensityFind, regionRoutine
+
+
+def legacy_findMaxIntensitiesFiltered(img):
+    """Reference copy of the original per-pixel implementation."""
+    imgS = img[:, :, 1]
+    imgV = img[:, :, 2]
+    maxSet = []
+    centerX = imgS.shape[0] / 2
+    centerY = imgS.shape[1] / 2
+    for i in range(imgS.shape[0]):
+        dX = abs(centerX - i)
+        for j in range(imgS.shape[1]):
+            dY = abs(centerY - j)
+            sF = intensityFind.cosCorrectFactor(dX, dY, centerX, centerY)
+            cS = sF * imgS[i, j]
+            cV = sF * imgV[i, j]
+            if cS <= intensityFind.BLACK_THRESH_S and cV <= intensityFind.BLACK_THRESH_V:
+                pass
+            else:
+                maxSet.append((i, j))
+    return maxSet
+
+
+def make_card(seed=0, shape=(1250, 730, 3)):
+    """Build a card-like BGR image: noisy lanes with dark separators."""
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 256, size=shape, dtype=np.uint8)
+    for lane in range(1, 14):
+        x = 17 + 53 * lane
+        img[:, x - 6 : x + 6, :] //= 8
+    img[::7, :, :] //= 8
+    return img
+
+
+def card_crops(img, regions):
+    """Yield the HSV ROI crops fullRoutine hands to the selector."""
+    imgHSV = cv.cvtColor(img, cv.COLOR_BGR2HSV)
+    for lane in range(1, 13):
+        laneStart = 17 + (53 * lane) + regionRoutine.HORIZONTAL_BORDER
+        laneEnd = 17 + (53 * (lane + 1)) - regionRoutine.HORIZONTAL_BORDER
+        for region in range(regions):
+            regionStart, regionEnd = regionRoutine.regionGen(regions, region)
+            yield imgHSV[regionStart:regionEnd, laneStart:laneEnd, :]
+
+
+class TestFilteredSelection:
+    """The vectorized selector must match the per-pixel loop exactly."""
+
+    @pytest.mark.parametrize("regions", [3, 10])
+    def test_matches_legacy_on_card_crops(self, regions):
+        img = make_card(seed=regions)
+        for roi in card_crops(img, regions):
+            expected = legacy_findMaxIntensitiesFiltered(roi)
+            assert intensityFind.findMaxIntensitiesFiltered(roi) == expected
+
+    def test_mask_matches_tuple_output(self):
+        roi = next(card_crops(make_card(seed=1), 6))
+        mask = intensityFind.findMaxIntensitiesFiltered(roi, asMask=True)
+        pixels = intensityFind.findMaxIntensitiesFiltered(roi)
+        assert mask.dtype == bool
+        assert mask.shape == roi.shape[:2]
+        assert list(zip(*np.nonzero(mask))) == pixels
+
+    def test_weight_map_matches_cosCorrectFactor(self):
+        height, width = 27, 29
+        weights = intensityFind.cosWeightMap(height, width)
+        for i in range(height):
+            for j in range(width):
+                expected = intensityFind.cosCorrectFactor(
+                    abs(height / 2 - i), abs(width / 2 - j), height / 2, width / 2
+                )
+                assert weights[i, j] == expected
+
+    def test_weight_map_is_cached_per_shape(self):
+        intensityFind.clearWeightCache()
+        first = intensityFind.cosWeightMap(40, 29)
+        second = intensityFind.cosWeightMap(40, 29)
+        assert first is second
+        assert not first.flags.writeable
+        info = intensityFind.weightCacheInfo()
+        assert info.hits == 1 and info.misses == 1
+        assert intensityFind.cosWeightMap(40, 29, 10, 10) is not first
+
+    def test_threshold_filter_matches_weighted_values(self):
+        roi = next(card_crops(make_card(seed=2), 3))
+        weights = intensityFind.cosWeightMap(*roi.shape[:2])
+        thresholds = intensityFind.weightThresholds(weights)
+        cS = weights * roi[..., 1]
+        cV = weights * roi[..., 2]
+        expected = ~(
+            (cS <= intensityFind.BLACK_THRESH_S) & (cV <= intensityFind.BLACK_THRESH_V)
+        )
+        np.testing.assert_array_equal(
+            intensityFind.applyThresholdFilter(roi, thresholds), expected
+        )
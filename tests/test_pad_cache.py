@@ -0,0 +1,77 @@
+"""Tests for the persistent PAD metadata cache."""
+
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+# Add src to path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pad_analytics import pad_cache
+
+
+URL = "https://pad.crc.nd.edu/api/v2/cards/7"
+
+
+class TestPadCache:
+    """TTL, invalidation and offline behaviour of the cache."""
+
+    def test_store_and_lookup(self):
+        assert pad_cache.lookup(URL, "cards") is None
+        pad_cache.store(URL, "cards", {"id": 7})
+        assert pad_cache.lookup(URL, "cards") == {"id": 7}
+
+    def test_expired_entries_only_served_offline(self):
+        pad_cache.store(URL, "cards", {"id": 7})
+        with patch("time.time", return_value=pad_cache.time.time() + 10 ** 6):
+            assert pad_cache.lookup(URL, "cards") is None
+            pad_cache.configure(offline=True)
+            try:
+                assert pad_cache.lookup(URL, "cards") == {"id": 7}
+            finally:
+                pad_cache._config["offline"] = None
+
+    def test_invalidate(self):
+        pad_cache.store(URL, "cards", {"id": 7})
+        pad_cache.store(URL + "8", "cards", {"id": 78})
+        pad_cache.store("projects", "projects", [])
+        assert pad_cache.invalidate(url=URL) == 1
+        assert pad_cache.invalidate(resource="cards") == 1
+        assert pad_cache.lookup("projects", "projects") == []
+        assert pad_cache.invalidate() == 1
+
+
+class TestCachedApi:
+    """get_data_api serves metadata resources from the cache."""
+
+    def test_second_call_is_cached(self):
+        padanalytics = pytest.importorskip("pad_analytics.padanalytics")
+        response = MagicMock()
+        response.json.return_value = {"id": 7, "sample_name": "Test"}
+        with patch("pad_analytics.pad_session.get", return_value=response) as get:
+            first = padanalytics.get_card_by_id(7)
+            second = padanalytics.get_card_by_id(7)
+        assert get.call_count == 1
+        assert first.equals(second)
+
+    def test_offline_without_cache(self, monkeypatch):
+        padanalytics = pytest.importorskip("pad_analytics.padanalytics")
+        monkeypatch.setenv("PAD_OFFLINE", "1")
+        with patch("pad_analytics.pad_session.get") as get:
+            assert padanalytics.get_model(3) is None
+        get.assert_not_called()
+
+    def test_unusable_cache_dir_falls_back_to_api(self, tmp_path, monkeypatch):
+        padanalytics = pytest.importorskip("pad_analytics.padanalytics")
+        blocker = tmp_path / "not_a_dir"
+        blocker.write_text("")
+        monkeypatch.setenv("PAD_CACHE_DIR", str(blocker / "cache"))
+        response = MagicMock()
+        response.json.return_value = {"id": 7, "sample_name": "Test"}
+        with patch("pad_analytics.pad_session.get", return_value=response) as get:
+            with pytest.warns(UserWarning, match="uncached"):
+                card = padanalytics.get_card_by_id(7)
+        assert get.call_count == 1
+        assert card["id"].tolist() == [7]
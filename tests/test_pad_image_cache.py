@@ -0,0 +1,87 @@
+"""Tests for the shared on-disk image cache."""
+
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+# Add src to path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pad_analytics import pad_cache, pad_image_cache
+
+
+@pytest.fixture(autouse=True)
+def default_settings():
+    yield
+    pad_image_cache.configure(max_bytes=pad_image_cache.DEFAULT_MAX_BYTES)
+
+
+class TestImageCache:
+    """URL-keyed, content-addressed images with LRU eviction."""
+
+    def test_second_read_is_a_hit(self):
+        fetch = MagicMock(return_value=b"png bytes")
+        before = pad_image_cache.stats()
+        assert pad_image_cache.get_bytes("https://pad/a.png", fetch) == b"png bytes"
+        assert pad_image_cache.get_bytes("https://pad/a.png", fetch) == b"png bytes"
+        assert fetch.call_count == 1
+        after = pad_image_cache.stats()
+        assert after["hits"] - before["hits"] == 1
+        assert after["misses"] - before["misses"] == 1
+        assert after["entries"] == 1 and after["bytes"] == 9
+
+    def test_identical_content_is_stored_once(self):
+        fetch = MagicMock(return_value=b"same")
+        pad_image_cache.get_bytes("https://pad/a.png", fetch)
+        pad_image_cache.get_bytes("https://pad/b.png", fetch)
+        blobs = [
+            name
+            for _, _, files in os.walk(pad_image_cache.image_dir())
+            for name in files
+            if not name.startswith("images.sqlite")
+        ]
+        assert len(blobs) == 1
+        assert pad_image_cache.invalidate("https://pad/a.png") == 1
+        assert pad_image_cache.get_bytes("https://pad/b.png", fetch) == b"same"
+        assert fetch.call_count == 2
+
+    def test_lru_eviction(self):
+        pad_image_cache.configure(max_bytes=10)
+
+        def fetch(url):
+            return url[-1].encode() * 4
+
+        pad_image_cache.get_bytes("https://pad/a", fetch)
+        pad_image_cache.get_bytes("https://pad/b", fetch)
+        pad_image_cache.get_bytes("https://pad/a", fetch)  # a is now most recent
+        pad_image_cache.get_bytes("https://pad/c", fetch)
+        fetch = MagicMock(side_effect=fetch)
+        pad_image_cache.get_bytes("https://pad/a", fetch)
+        pad_image_cache.get_bytes("https://pad/c", fetch)
+        fetch.assert_not_called()
+        assert pad_image_cache.stats()["bytes"] <= 10
+
+    def test_offline_miss_raises(self):
+        pad_cache.configure(offline=True)
+        try:
+            with pytest.raises(LookupError):
+                pad_image_cache.get_bytes("https://pad/missing.png", MagicMock())
+        finally:
+            pad_cache._config["offline"] = None
+
+    def test_default_fetch_uses_session(self):
+        response = MagicMock(content=b"data")
+        with patch("pad_analytics.pad_session.get", return_value=response) as get:
+            assert pad_image_cache.get_bytes("https://pad/x.png", verify=False) == b"data"
+        get.assert_called_once_with("https://pad/x.png", verify=False)
+
+    def test_unusable_cache_dir_downloads_uncached(self, tmp_path, monkeypatch):
+        blocker = tmp_path / "not_a_dir"
+        blocker.write_text("")
+        monkeypatch.setenv("PAD_CACHE_DIR", str(blocker / "cache"))
+        fetch = MagicMock(return_value=b"png bytes")
+        with pytest.warns(UserWarning, match="uncached"):
+            assert pad_image_cache.get_bytes("https://pad/a.png", fetch) == b"png bytes"
+        fetch.assert_called_once_with("https://pad/a.png")
@@ -0,0 +1,55 @@
+"""Tests for the shared PAD HTTP session."""
+
+import os
+import sys
+from unittest.mock import patch
+
+import pytest
+
+# Add src to path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+pytest.importorskip("requests")
+
+from pad_analytics import pad_session
+
+
+@pytest.fixture(autouse=True)
+def fresh_session():
+    pad_session.close()
+    yield
+    pad_session.configure(
+        pool_size=pad_session.DEFAULT_POOL_SIZE,
+        retries=pad_session.DEFAULT_RETRIES,
+        backoff=pad_session.DEFAULT_BACKOFF,
+        timeout=pad_session.DEFAULT_TIMEOUT,
+    )
+
+
+class TestPadSession:
+    """One pooled, retrying session is shared by every call."""
+
+    def test_session_is_reused(self):
+        assert pad_session.get_session() is pad_session.get_session()
+
+    def test_adapter_pool_and_retries(self):
+        pad_session.configure(pool_size=4, retries=2, backoff=0.1)
+        adapter = pad_session.get_session().get_adapter("https://pad.crc.nd.edu")
+        assert adapter._pool_maxsize == 4
+        assert adapter.max_retries.total == 2
+        assert adapter.max_retries.backoff_factor == 0.1
+        assert 503 in adapter.max_retries.status_forcelist
+        assert "POST" not in adapter.max_retries.allowed_methods
+
+    def test_configure_replaces_session(self):
+        first = pad_session.get_session()
+        pad_session.configure(retries=1)
+        assert pad_session.get_session() is not first
+
+    def test_default_timeout(self):
+        pad_session.configure(timeout=7)
+        with patch("requests.Session.get") as get:
+            pad_session.get("https://pad.crc.nd.edu/api/v2/projects")
+            pad_session.get("https://pad.crc.nd.edu/api/v2/projects", timeout=1)
+        assert get.call_args_list[0].kwargs["timeout"] == 7
+        assert get.call_args_list[1].kwargs["timeout"] == 1
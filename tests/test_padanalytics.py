@@ -15,7 +15,7 @@ import pad_analytics
 class TestPadAnalytics:
     """Test core padanalytics functions."""
     
-    @patch('pad_analytics.padanalytics.requests.get')
+    @patch('pad_analytics.pad_session.get')
     def test_get_projects_success(self, mock_get):
         """Test get_projects function with successful API response."""
         # Mock successful API response
@@ -35,7 +35,7 @@ class TestPadAnalytics:
         assert "id" in result.columns
         assert "name" in result.columns
     
-    @patch('pad_analytics.padanalytics.requests.get')
+    @patch('pad_analytics.pad_session.get')
     def test_get_projects_api_error(self, mock_get):
         """Test get_projects function with API error."""
         # Mock API error
@@ -49,7 +49,7 @@ class TestPadAnalytics:
         assert isinstance(result, pd.DataFrame)
         assert len(result) == 0
     
-    @patch('pad_analytics.padanalytics.requests.get')
+    @patch('pad_analytics.pad_session.get')
     def test_get_card_success(self, mock_get):
         """Test get_card function with successful response."""
         card_id = 12345
@@ -71,6 +71,323 @@ class TestPadAnalytics:
         assert result.iloc[0]["sample_name"] == "Test Sample"
 
 
+class TestBulkCards:
+    """Concurrent card fetching with a per-ID error report."""
+
+    def test_get_cards_partial_results(self):
+        import requests
+
+        def fake_get(url, **kwargs):
+            card_id = int(url.rsplit("/", 1)[1])
+            response = MagicMock()
+            if card_id == 2:
+                response.raise_for_status.side_effect = requests.HTTPError("404")
+            response.json.return_value = {"id": card_id, "project": {"id": 9}}
+            return response
+
+        with patch('pad_analytics.pad_session.get', side_effect=fake_get) as mock_get:
+            cards, errors = pad_analytics.get_cards([3, 2, 1], concurrency=2)
+            again, _ = pad_analytics.get_cards([3, 1])
+
+        assert list(cards["id"]) == [3, 1]
+        assert "project.id" in cards.columns
+        assert list(errors) == [2] and "404" in errors[2]
+        assert mock_get.call_count == 3
+        assert again.equals(cards)
+
+    def test_get_cards_inside_event_loop(self):
+        import asyncio
+
+        response = MagicMock()
+        response.json.return_value = {"id": 5}
+
+        async def main():
+            return pad_analytics.get_cards([5])
+
+        with patch('pad_analytics.pad_session.get', return_value=response):
+            cards, errors = asyncio.run(main())
+        assert list(cards["id"]) == [5] and errors == {}
+
+
+class TestProjectCards:
+    """Concurrent multi-project card fetching."""
+
+    @staticmethod
+    def fake_get(url, **kwargs):
+        project_id = int(url.split("/")[-2])
+        response = MagicMock()
+        if project_id == 1:
+            response.json.return_value = [{"id": 10, "quantity": 50}]
+        else:
+            response.json.return_value = [
+                {"id": 20, "quantity": None, "project": {"id": project_id}},
+                {"id": 21, "quantity": 20, "project": {"id": project_id}},
+            ]
+        return response
+
+    def test_combined_frame(self):
+        with patch('pad_analytics.pad_session.get', side_effect=self.fake_get):
+            cards = pad_analytics.get_project_cards(project_ids=[1, 2], concurrency=2)
+        assert list(cards["id"]) == [10, 20, 21]
+        assert cards["quantity"].dtype == float
+        assert list(cards.columns) == ["id", "quantity", "project.id"]
+
+    def test_callback_streams_projects_in_order(self):
+        seen = []
+        with patch('pad_analytics.pad_session.get', side_effect=self.fake_get):
+            result = pad_analytics.get_project_cards(
+                project_ids=[2, 1, 3],
+                concurrency=2,
+                callback=lambda project_id, df: seen.append((project_id, len(df))),
+            )
+        assert result is None
+        assert seen == [(2, 2), (1, 1), (3, 2)]
+
+
+class TestProjectCatalog:
+    """Indexed project name and id lookups."""
+
+    projects = pd.DataFrame(
+        {"id": [4, 7, 9], "project_name": ["FHI2020", "fhi2022", "Other"]}
+    )
+
+    def test_case_insensitive_lookups_load_once(self):
+        catalog = pad_analytics.ProjectCatalog(ttl=60)
+        with patch('pad_analytics.padanalytics.get_projects',
+                   return_value=self.projects) as mock_projects:
+            assert list(catalog.by_name("FHI2022")["id"]) == [7]
+            assert catalog.id_for("fhi2020") == 4
+            assert catalog.id_for("missing") is None
+            assert len(catalog.by_name("missing")) == 0
+            assert list(catalog.by_id(9)["project_name"]) == ["Other"]
+        assert mock_projects.call_count == 1
+
+    def test_refresh_after_ttl(self):
+        catalog = pad_analytics.ProjectCatalog(ttl=0)
+        with patch('pad_analytics.padanalytics.get_projects',
+                   return_value=self.projects) as mock_projects:
+            catalog.id_for("Other")
+            catalog.id_for("Other")
+        assert mock_projects.call_count == 2
+
+    def test_follows_pad_cache_settings(self):
+        from pad_analytics import pad_cache
+
+        catalog = pad_analytics.ProjectCatalog()
+        with patch('pad_analytics.padanalytics.get_projects',
+                   return_value=self.projects) as mock_projects:
+            catalog.id_for("Other")
+            catalog.id_for("Other")
+            assert mock_projects.call_count == 1
+            pad_cache.invalidate("projects")
+            catalog.id_for("Other")
+            assert mock_projects.call_count == 2
+            pad_cache.configure(ttls={"projects": 5})
+            try:
+                catalog.id_for("Other")
+                assert mock_projects.call_count == 2
+                with patch("time.time", return_value=pad_cache.time.time() + 10):
+                    catalog.id_for("Other")
+                assert mock_projects.call_count == 3
+            finally:
+                pad_cache.configure(ttls=pad_cache.DEFAULT_TTLS)
+
+    def test_keeps_list_while_pad_cache_is_off(self):
+        from pad_analytics import pad_cache
+
+        catalog = pad_analytics.ProjectCatalog()
+        pad_cache.configure(enabled=False)
+        try:
+            with patch('pad_analytics.padanalytics.get_projects',
+                       return_value=self.projects) as mock_projects:
+                catalog.id_for("Other")
+                catalog.id_for("FHI2020")
+            assert mock_projects.call_count == 1
+        finally:
+            pad_cache.configure(enabled=True)
+
+
+def sample_card(card_id, sample_id):
+    """A card payload as returned by the by-sample endpoint."""
+    return {
+        "id": card_id,
+        "sample_name": {"id": 1, "name": "Amoxicillin"},
+        "test_name": {"id": 2, "name": "12LanePADKenya2015"},
+        "user_name": {"id": 3, "name": "tester"},
+        "date_of_creation": "2020-01-01",
+        "raw_file_location": f"raw/{card_id}.png",
+        "processed_file_location": f"processed/{card_id}.png",
+        "camera_type_1": "phone",
+        "notes": "",
+        "sample_id": sample_id,
+        "quantity": 50,
+        "issue_id": None,
+        "project": {"id": 9, "name": "FHI2020"},
+    }
+
+
+class TestCardsBySample:
+    """Vectorized flattening of the by-sample payloads."""
+
+    @staticmethod
+    def fake_get(url, **kwargs):
+        sample_id = int(url.rsplit("/", 1)[1])
+        response = MagicMock()
+        if sample_id == 0:
+            response.json.return_value = {"success": False, "error": "no sample"}
+        else:
+            response.json.return_value = {
+                "success": True,
+                "data": [sample_card(sample_id * 10 + i, sample_id) for i in range(2)],
+            }
+        return response
+
+    def test_single_sample_schema(self):
+        with patch('pad_analytics.pad_session.get', side_effect=self.fake_get):
+            cards = pad_analytics.get_card_by_sample_id(4)
+        assert len(cards.columns) == 26
+        row = cards.iloc[0]
+        assert row["id"] == 40 and row["sample_name"] == "Amoxicillin"
+        assert row["project.project_name"] == "FHI2020" and row["project.id"] == 9
+        assert row["deleted"] == False and row["processing_date"] is None
+
+    def test_batch_matches_single_calls(self):
+        with patch('pad_analytics.pad_session.get', side_effect=self.fake_get):
+            cards, errors = pad_analytics.get_cards_by_sample_ids(
+                [3, 0, 5], concurrency=2
+            )
+            single = [pad_analytics.get_card_by_sample_id(i) for i in (3, 5)]
+        assert list(errors) == [0] and "no sample" in errors[0]
+        expected = pd.concat(single, ignore_index=True)
+        pd.testing.assert_frame_equal(cards, expected)
+
+
+class TestStreamingApi:
+    """Chunked normalization of large list responses."""
+
+    records = [
+        {"id": i, "quantity": None if i < 3 else i * 10, "project": {"id": i % 2}}
+        for i in range(7)
+    ]
+
+    def fake_response(self, *args, **kwargs):
+        import json
+
+        data = json.dumps(self.records).encode()
+        response = MagicMock()
+        response.iter_content.return_value = [
+            data[i:i + 5] for i in range(0, len(data), 5)
+        ]
+        return response
+
+    def test_chunks_keep_one_schema(self):
+        with patch('pad_analytics.pad_session.get', side_effect=self.fake_response):
+            chunks = list(pad_analytics.iter_project_cards(1, chunk_size=3))
+        assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+        assert all(chunk.dtypes.equals(chunks[0].dtypes) for chunk in chunks)
+        combined = pd.concat(chunks, ignore_index=True)
+        assert combined["id"].tolist() == list(range(7))
+        assert combined["quantity"].tolist()[3:] == [30, 40, 50, 60]
+        assert combined["project.id"].tolist() == [i % 2 for i in range(7)]
+
+    def test_explicit_schema_and_csv_output(self, tmp_path):
+        schema = {"id": "Int64", "quantity": "Float64", "notes": "string"}
+        path = str(tmp_path / "cards.csv")
+        with patch('pad_analytics.pad_session.get', side_effect=self.fake_response):
+            rows = pad_analytics.save_data_api("url", path, chunk_size=2, schema=schema)
+        assert rows == 7
+        written = pd.read_csv(path)
+        assert list(written.columns) == ["id", "quantity", "notes"]
+        assert written["id"].tolist() == list(range(7))
+
+    def test_inferred_numbers_accept_later_fractions(self):
+        self.records = [{"id": 1, "quantity": 50}, {"id": 2, "quantity": 12.5}]
+        with patch('pad_analytics.pad_session.get', side_effect=self.fake_response):
+            chunks = list(pad_analytics.iter_project_cards(1, chunk_size=1))
+        combined = pd.concat(chunks, ignore_index=True)
+        assert combined["quantity"].tolist() == [50.0, 12.5]
+
+    def test_json_array_split_at_every_offset(self):
+        from pad_analytics import padanalytics
+
+        text = b'[-25000000000.0, 1e+5, 2E-3, {"a": [1.5, "x"]}, true, null, 7]'
+        expected = [-25000000000.0, 1e+5, 2E-3, {"a": [1.5, "x"]}, True, None, 7]
+        for offset in range(len(text) + 1):
+            chunks = [text[:offset], text[offset:]]
+            assert list(padanalytics._iter_json_array(chunks)) == expected
+
+    def test_inferred_ids_stay_integers(self, tmp_path):
+        self.records = [
+            {"id": 12345, "project.id": 3, "quantity": 50},
+            {"id": 12346, "project.id": 4, "quantity": 12.5},
+        ]
+        path = str(tmp_path / "cards.csv")
+        with patch('pad_analytics.pad_session.get', side_effect=self.fake_response):
+            pad_analytics.save_data_api("url", path, chunk_size=1)
+        lines = open(path).read().splitlines()
+        assert lines[1:] == ["12345,3,50.0", "12346,4,12.5"]
+
+    def test_inferred_schema_rejects_unseen_columns(self):
+        self.records = [
+            {"id": 1, "issue": None},
+            {"id": 2, "issue": {"id": 3, "name": "leak"}},
+        ]
+        with patch('pad_analytics.pad_session.get', side_effect=self.fake_response):
+            chunks = pad_analytics.iter_project_cards(1, chunk_size=1)
+            assert next(chunks)["issue"].isna().all()
+            with pytest.raises(ValueError, match="issue.id"):
+                next(chunks)
+
+
+class TestPlsInMemory:
+    """PLS prediction from a path, encoded bytes or an array must agree."""
+
+    def test_quantity_sources_agree(self, tmp_path):
+        import numpy as np
+        cv = pytest.importorskip("cv2")
+        from pad_analytics import padanalytics
+
+        rng = np.random.default_rng(3)
+        card = rng.integers(0, 256, size=(1250, 730, 3), dtype=np.uint8)
+        path = str(tmp_path / "card.png")
+        cv.imwrite(path, card)
+        coefficients = tmp_path / "pls.csv"
+        weights = rng.random(12 * 10 * 3 + 1)
+        coefficients.write_text("amoxicillin," + ",".join(map(str, weights)) + "\n")
+        model = padanalytics.pls(str(coefficients))
+        with open(path, "rb") as handle:
+            encoded = handle.read()
+
+        expected = model.quantity(path, "Amoxicillin")
+        assert expected != -1.0
+        assert model.quantity(encoded, "Amoxicillin") == expected
+        assert model.quantity(card, "Amoxicillin") == expected
+
+    def test_predict_fetches_card_into_memory(self, tmp_path, monkeypatch):
+        from pad_analytics import padanalytics
+
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "pls.csv").write_text("amoxicillin,1\n")
+        card = pd.DataFrame(
+            {"sample_name": ["amoxicillin"], "quantity": [50],
+             "processed_file_location": ["card.png"]}
+        )
+        model = pd.DataFrame(
+            {"type": ["pls"], "weights_url": ["https://pad/pls.csv"],
+             "labels": [["amoxicillin"]]}
+        )
+        response = MagicMock(content=b"png bytes")
+        with patch.object(padanalytics, "get_card", return_value=card), \
+                patch.object(padanalytics, "get_model", return_value=model), \
+                patch.object(padanalytics.pls, "quantity", return_value=42.0) as quantity, \
+                patch("pad_analytics.pad_session.get", return_value=response) as get, \
+                patch("pad_analytics.pad_image_cache.get_bytes") as cached:
+            assert padanalytics.predict(1, 2) == ("amoxicillin", 42.0)
+        get.assert_called_once_with("https://pad.crc.nd.edu/card.png", verify=False)
+        cached.assert_not_called()
+        assert quantity.call_args[0][0] == b"png bytes"
+
+
 class TestPixelProcessing:
     """Test pixel processing functions."""
     
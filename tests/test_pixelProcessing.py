@@ -0,0 +1,77 @@
+"""Tests for the NumPy reductions in pixelProcessing."""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Add src to path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+cv = pytest.importorskip("cv2")
+
+from pad_analytics import pixelProcessing
+
+
+def legacy_means(pixels, img):
+    """Reference copy of the original scalar accumulation."""
+    totals = [0.0, 0.0, 0.0]
+    for x, y in pixels:
+        for c in range(3):
+            totals[c] += float(img[x, y, c])
+    if len(pixels) != 0:
+        totals = [t / len(pixels) for t in totals]
+    return totals
+
+
+@pytest.fixture
+def roi():
+    rng = np.random.default_rng(7)
+    return rng.integers(0, 256, size=(27, 29, 3), dtype=np.uint8)
+
+
+@pytest.fixture
+def mask(roi):
+    rng = np.random.default_rng(8)
+    return rng.random(roi.shape[:2]) > 0.3
+
+
+class TestMaskReductions:
+    """Mask and index-array variants must agree with the pixel-list loops."""
+
+    def test_rgb_matches_legacy(self, roi, mask):
+        pixels = list(zip(*np.nonzero(mask)))
+        b, g, r = legacy_means(pixels, roi)
+        expected = (int(r + 0.5), int(g + 0.5), int(b + 0.5))
+        assert pixelProcessing.avgPixelsMask(mask, roi) == expected
+        assert pixelProcessing.avgPixelsMask(np.nonzero(mask), roi) == expected
+        assert pixelProcessing.avgPixels(pixels, roi) == expected
+
+    def test_hsv_and_lab_match_legacy(self, roi, mask):
+        pixels = list(zip(*np.nonzero(mask)))
+        hsv = legacy_means(pixels, cv.cvtColor(roi, cv.COLOR_BGR2HSV))
+        lab = legacy_means(pixels, cv.cvtColor(roi, cv.COLOR_BGR2Lab))
+        assert pixelProcessing.avgPixelsHSVMask(mask, roi) == tuple(hsv)
+        assert pixelProcessing.avgPixelsLABMask(mask, roi) == tuple(
+            int(v + 0.5) for v in lab
+        )
+
+    def test_combined_entry_point(self, roi, mask):
+        rgb, hsv, lab = pixelProcessing.avgPixelsAll(mask, roi)
+        assert rgb == pixelProcessing.avgPixelsMask(mask, roi)
+        assert hsv == pixelProcessing.avgPixelsHSVMask(mask, roi)
+        assert lab == pixelProcessing.avgPixelsLABMask(mask, roi)
+
+    def test_two_pixel_tuple_is_a_pixel_list(self, roi):
+        pixels = ((0, 4), (0, 0))
+        b, g, r = legacy_means(list(pixels), roi)
+        expected = (int(r + 0.5), int(g + 0.5), int(b + 0.5))
+        assert pixelProcessing.avgPixels(pixels, roi) == expected
+        assert pixelProcessing.avgPixels(list(pixels), roi) == expected
+        assert pixelProcessing.avgPixelsMask(pixels, roi) == expected
+
+    def test_empty_selection(self, roi):
+        empty = np.zeros(roi.shape[:2], dtype=bool)
+        assert pixelProcessing.avgPixelsMask(empty, roi) == (0, 0, 0)
+        assert pixelProcessing.avgPixels([], roi) == (0, 0, 0)
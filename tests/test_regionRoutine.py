@@ -0,0 +1,245 @@
+"""Tests for feature extraction in regionRoutine."""
+
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Add src to path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+cv = pytest.importorskip("cv2")
+
+from pad_analytics import fileManagement, intensityFind, regionRoutine, roiGeometry
+
+
+@pytest.fixture(scope="module")
+def card():
+    rng = np.random.default_rng(11)
+    img = rng.integers(0, 256, size=(1250, 730, 3), dtype=np.uint8)
+    img[::5, :, :] //= 6
+    return img
+
+
+class TestExtractFeatures:
+    """The array API and the dict form must describe the same features."""
+
+    @pytest.mark.parametrize("RGB", [True, False])
+    def test_dict_is_view_of_array(self, card, RGB):
+        features = regionRoutine.extractFeatures(
+            card, intensityFind.findFilteredMask, RGB, 6
+        )
+        data = regionRoutine.fullRoutine(
+            card, intensityFind.findMaxIntensitiesFiltered, {}, RGB, 6
+        )
+        assert features.shape == (12, 6, 3)
+        assert list(data.keys()) == list(regionRoutine.featureColumns(6, RGB))
+        assert list(data.values()) == features.ravel().tolist()
+
+    def test_columns_match_genIndex(self):
+        assert list(regionRoutine.featureColumns(10)) == fileManagement.genIndex(10)[4:]
+        assert list(regionRoutine.featureColumns(3, False)) == fileManagement.genIndex(
+            3, ["L", "a", "b"]
+        )[4:]
+
+
+class TestRoiGeometry:
+    """The cached geometry tables must reproduce the lane/region arithmetic."""
+
+    @pytest.mark.parametrize("regions", [3, 6, 10])
+    def test_table_matches_arithmetic(self, regions):
+        bounds = roiGeometry.roiBounds(regions, (1250, 730, 3))
+        for lane in range(1, 13):
+            laneStart = 17 + (53 * lane) + regionRoutine.HORIZONTAL_BORDER
+            laneEnd = 17 + (53 * (lane + 1)) - regionRoutine.HORIZONTAL_BORDER
+            for region in range(regions):
+                regionStart, regionEnd = regionRoutine.regionGen(regions, region)
+                assert bounds[lane - 1, region].tolist() == [
+                    regionStart, regionEnd, laneStart, laneEnd
+                ]
+
+    def test_tables_are_cached_and_read_only(self):
+        bounds = roiGeometry.roiBounds(10, (1220, 730, 3))
+        assert bounds is roiGeometry.roiBounds(10, (1220, 730))
+        assert not bounds.flags.writeable
+        assert roiGeometry.roiSlices(10) is roiGeometry.roiSlices(10)
+        assert len(roiGeometry.roiSlices(10)) == 120
+
+    def test_rejects_small_cards(self):
+        with pytest.raises(ValueError):
+            roiGeometry.roiBounds(3, (500, 730, 3))
+
+
+class TestExtractMultiFeatures:
+    """Summed-area extraction must equal separate extractFeatures calls."""
+
+    def test_matches_separate_calls(self, card):
+        settings = [(3, True), (6, False), (10, True), (10, False)]
+        results = regionRoutine.extractMultiFeatures(card, settings)
+        assert list(results.keys()) == settings
+        for regions, RGB in settings:
+            expected = regionRoutine.extractFeatures(
+                card, intensityFind.findFilteredMask, RGB, regions
+            )
+            np.testing.assert_array_equal(results[(regions, RGB)], expected)
+
+
+class TestExtractFeaturesBatch:
+    """Batched extraction must equal per-card extractFeatures rows."""
+
+    @pytest.mark.parametrize("RGB", [True, False])
+    def test_matches_per_card(self, card, RGB):
+        stack = np.stack([card, card[::-1].copy(), np.zeros_like(card)])
+        result = regionRoutine.extractFeaturesBatch(stack, RGB, 10, chunkSize=2)
+        assert result.shape == (3, 12 * 10 * 3)
+        for row, img in zip(result, stack):
+            expected = regionRoutine.extractFeatures(
+                img, intensityFind.findFilteredMask, RGB, 10
+            )
+            np.testing.assert_array_equal(row, expected.ravel())
+
+    def test_accepts_list_and_leaves_input_untouched(self, card):
+        before = card.copy()
+        result = regionRoutine.extractFeaturesBatch([card, card], True, 3)
+        np.testing.assert_array_equal(result[0], result[1])
+        np.testing.assert_array_equal(card, before)
+
+    def test_rejects_non_uint8(self, card):
+        with pytest.raises(ValueError):
+            regionRoutine.extractFeaturesBatch(card.astype(np.float32)[None], True, 3)
+
+
+class TestDirectorySearch:
+    """Parallel directory extraction must match the serial run."""
+
+    def test_parallel_matches_serial(self, card, tmp_path):
+        source = tmp_path / "cards"
+        source.mkdir()
+        cv.imwrite(str(source / "1.png"), card)
+        cv.imwrite(str(source / "2.png"), card[::-1])
+        cv.imwrite(str(source / "small.png"), card[:100])
+        serial = regionRoutine.directorySearch(
+            str(source) + "/", True, 3, str(tmp_path / "serial") + "/"
+        )
+        parallel = regionRoutine.directorySearch(
+            str(source) + "/", True, 3, str(tmp_path / "parallel") + "/",
+            workers=2, maxInFlight=1,
+        )
+        assert sorted(serial.index) == ["1.png", "2.png"]
+        pd.testing.assert_frame_equal(serial, parallel)
+        log = (tmp_path / "parallel" / "log.txt").read_text()
+        assert "Error with file small.png" in log
+
+    def test_empty_directory(self, tmp_path):
+        source = tmp_path / "cards"
+        source.mkdir()
+        result = regionRoutine.directorySearch(
+            str(source) + "/", True, 3, str(tmp_path / "out") + "/"
+        )
+        assert len(result) == 0
+        assert list(result.columns) == list(regionRoutine.featureColumns(3, True))
+
+    def test_resume_of_finished_run(self, card, tmp_path):
+        source = tmp_path / "cards"
+        source.mkdir()
+        cv.imwrite(str(source / "1.png"), card)
+        save_dir = str(tmp_path / "out") + "/"
+        manifest = str(tmp_path / "run.manifest")
+        first = regionRoutine.directorySearch(
+            str(source) + "/", False, 3, save_dir, manifest=manifest
+        )
+        assert list(first.index) == ["1.png"]
+        rerun = regionRoutine.directorySearch(
+            str(source) + "/", False, 3, save_dir, manifest=manifest
+        )
+        assert len(rerun) == 0
+        assert list(rerun.columns) == list(first.columns)
+
+
+class TestValidateCards:
+    """Header validation must reject exactly what a full decode rejects."""
+
+    def test_reports_bad_files(self, card, tmp_path):
+        cv.imwrite(str(tmp_path / "good.png"), card)
+        cv.imwrite(str(tmp_path / "good.jpg"), card[:1220])
+        cv.imwrite(str(tmp_path / "small.jpg"), card[:100])
+        cv.imwrite(str(tmp_path / "small.bmp"), card[:100])
+        (tmp_path / "broken.png").write_bytes(b"\x89PNG\r\n\x1a\n\x00")
+        errors = regionRoutine.validateCards(str(tmp_path), workers=2)
+        assert sorted(os.path.basename(path) for path in errors) == [
+            "broken.png", "small.bmp", "small.jpg"
+        ]
+        assert "found shape (100, 730, 3)" in errors[str(tmp_path / "small.jpg")]
+
+
+def listing_row(name, path):
+    """A card listing row with the columns csvReader reads."""
+    values = [""] * 19
+    values[0], values[1], values[7], values[17], values[18] = (
+        name, "drug", path, "S1", "50"
+    )
+    return values
+
+
+@pytest.fixture
+def fake_session(card):
+    ok, encoded = cv.imencode(".png", card)
+    payloads = {"/a.png": encoded.tobytes(), "/b.png": b"not an image"}
+    calls = []
+
+    def get(url):
+        path = url[len("https://pad.crc.nd.edu"):]
+        calls.append(path)
+        return MagicMock(content=payloads[path])
+
+    with patch("pad_analytics.pad_session.get", side_effect=get):
+        yield calls
+
+
+class TestCsvReader:
+    """csvReader must extract downloaded cards from memory, in input order."""
+
+    def test_pipelined_rows(self, card, tmp_path, fake_session):
+        listing = tmp_path / "cards.csv"
+        pd.DataFrame(
+            [
+                listing_row("1", "/a.png"),
+                listing_row("2", "/b.png"),
+                listing_row("3", "/a.png"),
+            ]
+        ).to_csv(listing, header=False, index=False)
+        runs = regionRoutine.addIndex({"3_region_rgb.csv": {"RGB": True, "regions": 3}})
+        save_dir = str(tmp_path / "out") + "/"
+        regionRoutine.csvReader(
+            str(listing), runs, save_dir, downloadWorkers=2, workers=2, queueSize=1
+        )
+        result = pd.read_csv(save_dir + "3_region_rgb.csv", index_col=0)
+        assert list(result.index) == [1, 3]
+        expected = regionRoutine.extractFeatures(
+            card, intensityFind.findFilteredMask, True, 3
+        ).ravel()
+        np.testing.assert_array_equal(
+            result.loc[1, list(regionRoutine.featureColumns(3))].to_numpy(), expected
+        )
+        assert "with file 2" in (tmp_path / "out" / "log.txt").read_text()
+
+    def test_resume_writes_each_row_once(self, tmp_path, fake_session):
+        listing = tmp_path / "cards.csv"
+        pd.DataFrame([listing_row("1", "/a.png"), listing_row("2", "/a.png")]).to_csv(
+            listing, header=False, index=False
+        )
+        runs = regionRoutine.addIndex({"3_region_lab.csv": {"RGB": False, "regions": 3}})
+        save_dir = str(tmp_path / "out") + "/"
+        manifest = str(tmp_path / "run.manifest")
+        regionRoutine.csvReader(str(listing), runs, save_dir, manifest=manifest)
+        # Simulate a crash that left half a row behind
+        with open(save_dir + "3_region_lab.csv", "a") as output:
+            output.write("3,drug,50,S1,1,2")
+        fake_session.clear()
+        regionRoutine.csvReader(str(listing), runs, save_dir, manifest=manifest)
+        assert fake_session == []
+        result = pd.read_csv(save_dir + "3_region_lab.csv", index_col=0)
+        assert list(result.index) == [1, 2]